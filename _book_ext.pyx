@@ -0,0 +1,83 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+# distutils: extra_compile_args = -O3 -march=native
+"""
+Compiled fast path for grok._flatten_l2.
+
+parse_side walks one side of a Schwab level-2 payload and returns the
+(price, size, venue id) arrays that grok's _Book holds. keys is the
+(price, orders, exchange, volume) field-name tuple from grok._l2_keys. It only handles
+clean input: the first malformed level, order, exchange code or volume
+makes it return None, and grok re-parses that side in Python so the usual
+L2_ERROR lines are logged exactly once, the same way as without the
+extension.
+
+Build in place next to grok.py with:  cythonize -i _book_ext.pyx
+"""
+
+import numpy as np
+
+
+cdef inline double _as_double(object value) except? -1.0:
+    if type(value) is float:
+        return <double>value
+    return float(value)
+
+
+def parse_side(list entries, tuple keys, dict ex_id):
+    cdef Py_ssize_t n = 0, cap = 64
+    cdef double price_f
+    cdef long long vol_i
+    cdef object level, orders, order, price, ex, vid, vol
+    cdef object prices = np.empty(cap, np.float64)
+    cdef object sizes = np.empty(cap, np.int64)
+    cdef object venues = np.empty(cap, np.int16)
+    cdef double[::1] p_view = prices
+    cdef long long[::1] s_view = sizes
+    cdef short[::1] v_view = venues
+    price_key, orders_key, ex_key, volume_key = keys
+
+    for level in entries:
+        if type(level) is not dict:
+            return None
+        price = (<dict>level).get(price_key)
+        if price is None:
+            return None
+        try:
+            price_f = _as_double(price)
+        except (TypeError, ValueError):
+            return None
+        if price_f <= 0:
+            return None
+        orders = (<dict>level).get(orders_key)
+        if not orders:
+            return None
+        for order in orders:
+            if type(order) is not dict:
+                return None
+            ex = (<dict>order).get(ex_key)
+            vid = ex_id.get(ex)
+            if vid is None:
+                return None
+            vol = (<dict>order).get(volume_key)
+            try:
+                if type(vol) is int:
+                    vol_i = vol
+                else:
+                    vol_i = <long long>int(_as_double(vol))
+            except (TypeError, ValueError, OverflowError):
+                return None
+            if vol_i <= 0:
+                return None
+            if n == cap:
+                cap *= 2
+                prices = np.resize(prices, cap)
+                sizes = np.resize(sizes, cap)
+                venues = np.resize(venues, cap)
+                p_view = prices
+                s_view = sizes
+                v_view = venues
+            p_view[n] = price_f
+            s_view[n] = vol_i
+            v_view[n] = <short>vid
+            n += 1
+    return prices[:n].copy(), sizes[:n].copy(), venues[:n].copy()
@@ -1,9 +1,61 @@
 # auth_login.py
-import os, sys, argparse
-from pathlib import Path
-from dotenv import load_dotenv
-from urllib.parse import urlparse
-from schwab import auth
+# Heavy imports (schwab.auth pulls in httpx/authlib, plus dotenv) are deferred to the code paths that use them to keep cold start short.
+import os, re, sys, json, pickle, time
+from types import SimpleNamespace
+
+# Skip re-validating the token file when the access token has at least this
+# many seconds left (matches schwab-py's own refresh leeway).
+_FRESH_TOKEN_MIN_SECS = 300
+# A '<token_path>.ok' marker younger than this means the token was validated
+# recently enough to skip even reading it.
+_VALIDATED_MARKER_TTL_SECS = 60
+# What loading the token client can raise: it only reads and parses the file
+# (JSONDecodeError and schwab-py's legacy-format error are ValueErrors).
+_TOKEN_LOAD_ERRORS = (OSError, ValueError, KeyError)
+_ALLOWED_SCHEMES = frozenset(("http", "https"))
+# scheme://netloc[/path]; netloc stops at the first '/', '?' or '#' like urlparse.
+_CALLBACK_RE = re.compile(
+    r"^(%s)://([^/?#]+)([/?#].*)?$" % "|".join(sorted(_ALLOWED_SCHEMES)), re.IGNORECASE
+)
+_ENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+_ENV_CACHE_PATH = os.path.expanduser("~/.cache/schwab_auth/env.pkl")
+
+
+def _load_env_cached(path: str = _ENV_PATH) -> dict:
+    """
+    Load .env into os.environ (existing vars win, like load_dotenv), reusing a
+    pickled parse from _ENV_CACHE_PATH while the file's mtime/size are unchanged.
+    Returns the parsed key/value map.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return {}
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+    values = None
+    try:
+        with open(_ENV_CACHE_PATH, "rb") as f:
+            cached = pickle.load(f)
+        if cached.get("key") == key:
+            values = cached["values"]
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError):
+        values = None
+
+    if values is None:
+        from dotenv import dotenv_values
+        values = {k: v for k, v in dotenv_values(path).items() if v is not None}
+        try:
+            os.makedirs(os.path.dirname(_ENV_CACHE_PATH), mode=0o700, exist_ok=True)
+            fd = os.open(_ENV_CACHE_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump({"key": key, "values": values}, f)
+        except OSError:
+            pass  # cache is best-effort; the parse result is still valid
+
+    for k, v in values.items():
+        os.environ.setdefault(k, v)
+    return values
 
 
 def _normalize_and_validate_callback(url: str) -> str:
@@ -13,85 +65,293 @@ def _normalize_and_validate_callback(url: str) -> str:
     """
     if not url:
         raise ValueError("SCHWAB_REDIRECT_URI is empty")
-    parsed = urlparse(url)
-    if parsed.scheme not in {"http", "https"} or not parsed.netloc:
+    if not _CALLBACK_RE.match(url):
         raise ValueError(f"Invalid SCHWAB_REDIRECT_URI '{url}'. Expected full URL like 'https://127.0.0.1:8182/'.")
-    normalized = url if url.endswith("/") else url + "/"
+    normalized = url if url[-1] == "/" else url + "/"
     return normalized
 
+def _read_token(token_path: str) -> bytes | None:
+    """
+    Return the raw token file bytes, or None if it does not exist. Doubles as
+    the existence check so the file is only touched once.
+    """
+    try:
+        with open(token_path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _load_token_json(token_path: str) -> dict:
+    """token_read_func for schwab-py's client_from_access_functions."""
+    with open(token_path, "rb") as f:
+        return json.loads(f.read())
+
+def _make_atomic_token_writer(token_path: str):
+    """
+    token_write_func for schwab-py: serialize the token once and persist it
+    with a single write + fsync + rename (mode 0600), instead of json.dump's
+    many small writes into the live file.
+    """
+    def write_token(token, *args, **kwargs) -> None:
+        buf = memoryview(json.dumps(token, separators=(",", ":")).encode())
+        tmp = token_path + ".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            while buf:
+                buf = buf[os.write(fd, buf):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, token_path)
+    return write_token
+
+def _token_seconds_left(token_raw: bytes | None) -> float:
+    """
+    Seconds until the access token in the raw schwab-py token JSON expires.
+    Returns 0.0 if the token is missing or unreadable.
+    """
+    if not token_raw:
+        return 0.0
+    try:
+        data = json.loads(token_raw)
+        token = data.get("token", data)
+        return float(token["expires_at"]) - time.time()
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return 0.0
+
+_out: list[str] = []
+# --machine replaces the human status lines with one JSON line at exit.
+_machine = False
+_token_path_for_status: str | None = None
+
+def _say(msg: str) -> None:
+    """Queue a status line; everything queued is written once by _flush_out()."""
+    _out.append(msg)
+
+def _flush_out() -> None:
+    # Status lines are for humans: stay silent under cron/pipes (errors still
+    # go to stderr, and --machine output is written separately).
+    if _out and not _machine and sys.stdout.isatty():
+        sys.stdout.write("\n".join(_out) + "\n")
+    _out.clear()
+
+def _emit_machine_status(ok: bool) -> None:
+    """Write {"ok", "path", "expires_at"} as a single JSON line."""
+    path = _token_path_for_status
+    left = _token_seconds_left(_read_token(path)) if ok and path else 0.0
+    status = {"ok": ok, "path": path, "expires_at": round(time.time() + left) if left > 0 else None}
+    sys.stdout.write(json.dumps(status) + "\n")
+
+def _recently_validated(token_path: str) -> bool:
+    """True if '<token_path>.ok' was touched within _VALIDATED_MARKER_TTL_SECS."""
+    try:
+        return time.time() - os.path.getmtime(token_path + ".ok") < _VALIDATED_MARKER_TTL_SECS
+    except OSError:
+        return False
+
+def _mark_validated(token_path: str) -> None:
+    """Touch '<token_path>.ok' after a successful token load/refresh."""
+    marker = token_path + ".ok"
+    with open(marker, "a"):
+        pass
+    os.utime(marker, None)
+
+def _write_expiry_sidecar(token_path: str, expires_at: float) -> None:
+    """
+    Write the token's expires_at epoch to '<token_path>.expires_at' so other
+    processes can check freshness without parsing the token JSON.
+    """
+    sidecar = token_path + ".expires_at"
+    tmp = sidecar + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(f"{expires_at:.0f}\n")
+    os.replace(tmp, sidecar)
+
+def _run_refresh_daemon(token_path: str, api_key: str, app_secret: str) -> None:
+    """
+    Sleep until the access token is _FRESH_TOKEN_MIN_SECS from expiry, refresh
+    it, and repeat, so callers never pay for an inline refresh.
+    """
+    from schwab import auth
+
+    _say(f"🔁 Refresh daemon running (token path: {token_path})")
+    _flush_out()
+    while True:
+        # +1s so the token is inside schwab-py's refresh leeway when we wake.
+        try:
+            time.sleep(max(1.0, _token_seconds_left(_read_token(token_path)) - _FRESH_TOKEN_MIN_SECS + 1))
+        except KeyboardInterrupt:
+            _say("🛑 Refresh daemon stopped.")
+            return
+        try:
+            client = auth.client_from_access_functions(
+                api_key,
+                app_secret,
+                lambda: _load_token_json(token_path),
+                _make_atomic_token_writer(token_path),
+            )
+            # Refreshes (and rewrites the token file) once inside the leeway window.
+            client.session.ensure_active_token()
+            left = _token_seconds_left(_read_token(token_path))
+            _write_expiry_sidecar(token_path, time.time() + left)
+            _say(f"✅ Token refreshed; {left:.0f}s until expiry.")
+            _flush_out()
+        except Exception as e:
+            sys.stderr.write(f"⚠️  Background refresh failed ({e}). Retrying in 60s…\n")
+            time.sleep(60)
+
+_USAGE = """\
+usage: auth_login.py [-h] [--force-login] [--non-interactive] [--timeout SECONDS] [--daemon] [--machine]
+
+Initialize/refresh Schwab OAuth tokens.
+
+options:
+  -h, --help         show this help message and exit
+  --force-login      Force interactive login even if token file exists.
+  --non-interactive  Attempt non-interactive auth (if supported).
+  --timeout SECONDS  Callback wait timeout (seconds) for login flow (default 300).
+  --daemon           Keep running and refresh the token shortly before it expires.
+  --machine          Print one JSON status line instead of human-readable output.
+"""
+
+def _parse_args(argv: list[str]) -> SimpleNamespace:
+    """
+    Minimal parser for the handful of flags above; argparse costs more to
+    import than this whole script takes to run on the cached path.
+    """
+    args = SimpleNamespace(force_login=False, non_interactive=False, timeout=300, daemon=False, machine=False)
+    flags = {"--force-login": "force_login", "--non-interactive": "non_interactive",
+             "--daemon": "daemon", "--machine": "machine"}
+    it = iter(argv)
+    for arg in it:
+        if arg in flags:
+            setattr(args, flags[arg], True)
+        elif arg in ("-h", "--help"):
+            sys.stdout.write(_USAGE)
+            sys.exit(0)
+        elif arg == "--timeout" or arg.startswith("--timeout="):
+            raw = arg.partition("=")[2] if "=" in arg else next(it, "")
+            try:
+                args.timeout = int(raw)
+            except ValueError:
+                sys.stderr.write(_USAGE.split("\n\n")[0] + f"\nauth_login.py: error: invalid --timeout value: '{raw}'\n")
+                sys.exit(2)
+        else:
+            sys.stderr.write(_USAGE.split("\n\n")[0] + f"\nauth_login.py: error: unrecognized arguments: {arg}\n")
+            sys.exit(2)
+    return args
+
 def main() -> None:
-    parser = argparse.ArgumentParser(description="Initialize/refresh Schwab OAuth tokens.")
-    parser.add_argument("--force-login", action="store_true", help="Force interactive login even if token file exists.")
-    parser.add_argument("--non-interactive", action="store_true", help="Attempt non-interactive auth (if supported).")
-    parser.add_argument("--timeout", type=int, default=300, help="Callback wait timeout (seconds) for login flow.")
-    args = parser.parse_args()
-
-    load_dotenv()
-    api_key    = os.getenv("SCHWAB_CLIENT_ID")      # App Key (no @AMER.OAUTHAP for schwab-py)
-    app_secret = os.getenv("SCHWAB_APP_SECRET")     # App Secret
-    callback   = os.getenv("SCHWAB_REDIRECT_URI")   # e.g., https://127.0.0.1:8182/
-    token_path = os.getenv("SCHWAB_TOKEN_PATH", "./schwab_tokens.json")
-
-    missing = [k for k,v in {
-        "SCHWAB_CLIENT_ID": api_key,
-        "SCHWAB_APP_SECRET": app_secret,
-        "SCHWAB_REDIRECT_URI": callback,
-    }.items() if not v]
+    ok = False
+    try:
+        _main()
+        ok = True
+    finally:
+        _flush_out()
+        if _machine:
+            _emit_machine_status(ok)
+
+def _main() -> None:
+    args = _parse_args(sys.argv[1:])
+    global _machine, _token_path_for_status
+    _machine = args.machine
+
+    _load_env_cached()
+    env = os.environ
+    api_key    = env.get("SCHWAB_CLIENT_ID")      # App Key (no @AMER.OAUTHAP for schwab-py)
+    app_secret = env.get("SCHWAB_APP_SECRET")     # App Secret
+    callback   = env.get("SCHWAB_REDIRECT_URI")   # e.g., https://127.0.0.1:8182/
+    token_path = env.get("SCHWAB_TOKEN_PATH", "./schwab_tokens.json")
+    _token_path_for_status = token_path
+
+    missing = []
+    if not api_key:
+        missing.append("SCHWAB_CLIENT_ID")
+    if not app_secret:
+        missing.append("SCHWAB_APP_SECRET")
+    if not callback:
+        missing.append("SCHWAB_REDIRECT_URI")
     if missing:
-        print(f"❌ Missing env vars: {', '.join(missing)}", file=sys.stderr)
+        sys.stderr.write(f"❌ Missing env vars: {', '.join(missing)}\n")
         sys.exit(1)
 
     try:
         callback = _normalize_and_validate_callback(callback)
     except ValueError as e:
-        print(f"❌ {e}", file=sys.stderr)
+        sys.stderr.write(f"❌ {e}\n")
         sys.exit(2)
 
-    token_file = Path(token_path)
-    # Ensure token directory exists
-    token_file.parent.mkdir(parents=True, exist_ok=True)
-
     def do_login_flow() -> None:
-        print(f"🔐 Starting login flow… (token path: {token_file})")
+        from schwab import auth
+
+        # Only the login flow creates the token file, so only it needs the
+        # directory; an existing token already implies the directory exists.
+        token_dir = os.path.dirname(token_path) or "."
+        if not os.path.isdir(token_dir):
+            os.makedirs(token_dir, exist_ok=True)
+        # Shown right away: the login flow is interactive.
+        _say(f"🔐 Starting login flow… (token path: {token_path})")
+        _flush_out()
         try:
             auth.client_from_login_flow(
                 api_key=api_key,
                 app_secret=app_secret,
                 callback_url=callback,
-                token_path=str(token_file),
+                token_path=token_path,
+                token_write_func=_make_atomic_token_writer(token_path),
                 callback_timeout=args.timeout,
                 interactive=not args.non_interactive,
             )
-            print(f"✅ Token saved to {token_file.resolve()}")
+            _say(f"✅ Token saved to {os.path.abspath(token_path)}")
         except Exception as e:
-            print(f"❌ Login flow failed: {e}", file=sys.stderr)
+            sys.stderr.write(f"❌ Login flow failed: {e}\n")
             sys.exit(3)
 
+    if not args.force_login and _recently_validated(token_path):
+        _say("✅ Auth OK (cached). Token validated within the last minute.")
+        if args.daemon:
+            _run_refresh_daemon(token_path, api_key, app_secret)
+        return
+
     # Run login if forced or token missing
-    if args.force_login or not token_file.exists():
+    token_raw = None if args.force_login else _read_token(token_path)
+    if token_raw is None:
         do_login_flow()
+    elif _token_seconds_left(token_raw) > _FRESH_TOKEN_MIN_SECS:
+        _say("✅ Auth OK (cached). Access token still fresh.")
+        if args.daemon:
+            _run_refresh_daemon(token_path, api_key, app_secret)
+        return
+
+    from schwab import auth
+
+    write_token = _make_atomic_token_writer(token_path)
+
+    def load_client():
+        # Same as client_from_token_file, but refreshed tokens are written
+        # atomically by write_token.
+        return auth.client_from_access_functions(
+            api_key, app_secret, lambda: _load_token_json(token_path), write_token
+        )
 
     # Try to refresh/validate tokens; if it fails, fall back to login once.
     try:
-        _ = auth.client_from_token_file(
-            token_path=str(token_file),
-            api_key=api_key,
-            app_secret=app_secret,
-        )
-        print("✅ Auth OK. Token file loaded/refreshed.")
-    except Exception as e:
-        print(f"⚠️  Token refresh failed ({e}). Trying login flow once…", file=sys.stderr)
+        load_client()
+        _mark_validated(token_path)
+        _say("✅ Auth OK. Token file loaded/refreshed.")
+    except _TOKEN_LOAD_ERRORS as e:
+        sys.stderr.write(f"⚠️  Token refresh failed ({e}). Trying login flow once…\n")
         do_login_flow()
         try:
-            _ = auth.client_from_token_file(
-                token_path=str(token_file),
-                api_key=api_key,
-                app_secret=app_secret,
-            )
-            print("✅ Auth OK after re-login. Token file loaded/refreshed.")
-        except Exception as e2:
-            print(f"❌ Auth failed even after re-login: {e2}", file=sys.stderr)
+            load_client()
+            _mark_validated(token_path)
+            _say("✅ Auth OK after re-login. Token file loaded/refreshed.")
+        except _TOKEN_LOAD_ERRORS as e2:
+            sys.stderr.write(f"❌ Auth failed even after re-login: {e2}\n")
             sys.exit(4)
 
+    if args.daemon:
+        _run_refresh_daemon(token_path, api_key, app_secret)
+
 if __name__ == "__main__":
     main()
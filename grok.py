@@ -19,18 +19,37 @@ import os
 import sys
 import argparse
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from queue import SimpleQueue
 from urllib.parse import urlparse
 from collections import deque, defaultdict
+from contextlib import contextmanager
 from dataclasses import dataclass
-from time import time
-from typing import Deque, Dict, List, Optional, TypedDict
+from functools import partial
+from time import monotonic, time
+from typing import Deque, Dict, List, Mapping, NamedTuple, Optional
 import sqlite3
 import json
 import logging
+import logging.handlers
+import numpy as np
+try:  # optional: JIT-compiles the per-venue accumulation kernel below
+    from numba import njit
+except ImportError:
+    njit = None
+try:  # optional: compiled fast path for _flatten_l2 (cythonize -i _book_ext.pyx)
+    import _book_ext
+except ImportError:
+    _book_ext = None
+try:  # optional: faster JSON encoding for log_structured
+    import orjson
+except ImportError:
+    orjson = None
 from dotenv import load_dotenv
 from schwab.auth import easy_client
 from schwab.client import Client
+from schwab.contrib.util import StreamJsonDecoder  # set_json_decoder checks against this path
 from schwab.streaming import StreamClient
 
 # Configure Logging
@@ -38,11 +57,37 @@ from schwab.streaming import StreamClient
 # without digging through print statements.
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# When grok runs as a script the configured handlers are moved behind a
+# QueueListener thread, so log_structured only renders the line and enqueues
+# it; the stdout write happens off the event loop. Timestamps still come from
+# the moment the record was created.
+def _start_log_listener() -> logging.handlers.QueueListener:
+    root = logging.getLogger()
+    log_queue: SimpleQueue = SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    listener.start()
+    return listener
+
 # Small helper: print a JSON line with a consistent shape so humans and tools
 # can read it easily. Warnings are elevated when they relate to alerts.
+# Callers run on the per-message hot path, so bail out before building the
+# payload or serializing it when the level is filtered anyway.
 def log_structured(event: str, data: dict):
     level = logging.INFO if event != "ALERT" else logging.WARNING
-    logging.log(level, json.dumps({"event": event, **data}))
+    if not logging.root.isEnabledFor(level):
+        return
+    payload = {"event": event, **data}
+    line = orjson.dumps(payload).decode() if orjson else json.dumps(payload)
+    logging.log(level, line)
+
+# Stream decoding
+# schwab-py parses every websocket frame with json.loads by default; swap in
+# orjson when it is available. orjson.JSONDecodeError subclasses the stdlib
+# one, so the library's parse-error handling keeps working.
+class _OrjsonStreamDecoder(StreamJsonDecoder):
+    def decode_json_string(self, raw):
+        return orjson.loads(raw)
 
 # Exchange Code Mapping
 # Schwab sends short exchange codes; this map turns them into readable names
@@ -65,6 +110,16 @@ EXCHANGE_MAP = {
     "BOSX": "BOX",
     "PHLX": "NASDAQ_PHLX"
 }
+# Small integer id per exchange code so per-venue totals can live in fixed-size
+# NumPy arrays indexed by venue instead of dicts keyed by string. The NSDQ
+# alias is folded into NASDAQ here so the order loop needs a single lookup.
+_EX_ID: Dict[str, int] = {sys.intern(code): i for i, code in enumerate(EXCHANGE_MAP)}
+_EX_ID["NSDQ"] = _EX_ID["NASDAQ"]
+_EX_CODES: tuple = tuple(EXCHANGE_MAP)
+_EX_NAMES: tuple = tuple(EXCHANGE_MAP.values())
+
+# Symbols whose book exchange is pinned instead of looked up at startup.
+_HARDCODED_EX: Dict[str, str] = {"CRON": "NASDAQ", "F": "NYSE"}
 
 # Helpers
 # Environment + parsing utilities so the rest of the file can assume clean
@@ -77,8 +132,12 @@ def _normalize_and_validate_callback(url: str) -> str:
         raise ValueError(f"Invalid SCHWAB_REDIRECT_URI '{url}'. Expected full URL like 'https://127.0.0.1:8182/'.")
     return url if url.endswith("/") else url + "/"
 
+# Env lookups read from a plain-dict snapshot taken once in main() after
+# load_dotenv(), instead of going through the os.environ proxy per setting.
+_ENV: Mapping[str, str] = os.environ
+
 def _get_int_env(name: str, default: int, minimum: int = 1) -> int:
-    raw = os.getenv(name)
+    raw = _ENV.get(name)
     if raw is None or raw == "":
         return max(default, minimum)
     try:
@@ -88,13 +147,13 @@ def _get_int_env(name: str, default: int, minimum: int = 1) -> int:
     return max(val, minimum)
 
 def _bool_env(name: str, default: bool = False) -> bool:
-    raw = os.getenv(name)
+    raw = _ENV.get(name)
     if raw is None:
         return default
     return raw.strip().lower() in {"1", "true", "yes", "on"}
 
 def _get_float_env(name: str, default: float, minimum: float = 0.0) -> float:
-    raw = os.getenv(name)
+    raw = _ENV.get(name)
     if raw is None or raw == "":
         return max(default, minimum)
     try:
@@ -104,7 +163,7 @@ def _get_float_env(name: str, default: float, minimum: float = 0.0) -> float:
     return max(val, minimum)
 
 def _parse_symbols_from_env(var_name: str = "SYMBOLS", fallback: str = "F") -> List[str]:
-    raw = os.getenv(var_name, fallback)
+    raw = _ENV.get(var_name, fallback)
     parts = [p.strip().upper() for p in raw.replace(" ", ",").split(",")]
     seen, out = set(), []
     for p in parts:
@@ -115,119 +174,192 @@ def _parse_symbols_from_env(var_name: str = "SYMBOLS", fallback: str = "F") -> L
     return out
 
 # Book Processing
-# Convert the raw level-2 order book into bid/ask lists we can count. This is
-# the heart of the imbalance detection logic.
-class _Row(TypedDict, total=False):
-    EX: str
-    SIZE: int
-    PRICE: float
+# Convert the raw level-2 order book into bid/ask arrays we can count. This is
+# the heart of the imbalance detection logic. Each side is stored as parallel
+# NumPy arrays (price, size, venue id) so process_book can total venues with
+# array reductions instead of walking per-order dicts.
+class _Book(NamedTuple):
+    bid_price: np.ndarray  # float64
+    bid_size: np.ndarray   # int64
+    bid_venue: np.ndarray  # int16, index into _EX_CODES
+    ask_price: np.ndarray
+    ask_size: np.ndarray
+    ask_venue: np.ndarray
+
+# Field names for (price, orders, exchange, volume) on each side. schwab-py's
+# book handler relabels payloads to the named keys; raw frames use the
+# numeric ones. A side never mixes the two, so _flatten_l2 picks one set per
+# side up front instead of probing both keys on every level and order.
+_L2_NUMERIC_KEYS = ("0", "3", "0", "1")
+_L2_NAMED_KEYS = {
+    True: ("BID_PRICE", "BIDS", "EXCHANGE", "BID_VOLUME"),
+    False: ("ASK_PRICE", "ASKS", "EXCHANGE", "ASK_VOLUME"),
+}
 
-class _Book(TypedDict, total=False):
-    BIDS: List[_Row]
-    ASKS: List[_Row]
+def _l2_keys(entries: list, is_bid: bool) -> tuple:
+    for level in entries:
+        if isinstance(level, dict):
+            return _L2_NUMERIC_KEYS if "0" in level else _L2_NAMED_KEYS[is_bid]
+    return _L2_NAMED_KEYS[is_bid]
+
+# Order sizes usually arrive as ints already; only decimal strings like
+# "12.5" need the float round-trip that int(float(v)) did for every row.
+def _to_int(v) -> int:
+    t = type(v)
+    if t is int:
+        return v
+    if t is float:
+        return int(v)
+    try:
+        return int(v)
+    except ValueError:
+        return int(float(v))
+
+# Bits for L2 errors that are only logged once per payload (shared by both
+# sides); _parse_entries threads the mask through instead of a dict.
+_L2_MISSING_PRICE = 1
+_L2_PARSE_PRICE_ERROR = 2
+_L2_INVALID_PRICE = 4
+_L2_INVALID_LEVEL = 8
+
+def _parse_entries(entries, is_bid: bool, symbol: str, reported: int):
+    prices: List[float] = []
+    sizes: List[int] = []
+    venues: List[int] = []
+    if not isinstance(entries, list):
+        if not reported & _L2_INVALID_LEVEL:
+            log_structured("L2_ERROR", {"symbol": symbol, "error": f"Non-list {'bids' if is_bid else 'asks'}"})
+            reported |= _L2_INVALID_LEVEL
+        return prices, sizes, venues, reported
+    price_key, orders_key, ex_key, vol_key = _l2_keys(entries, is_bid)
+    for level in entries:
+        if not isinstance(level, dict):
+            if not reported & _L2_INVALID_LEVEL:
+                log_structured("L2_ERROR", {"symbol": symbol, "error": f"Invalid {'bid' if is_bid else 'ask'} level"})
+                reported |= _L2_INVALID_LEVEL
+            continue
+        price = level.get(price_key)
+        if price is None:
+            if not reported & _L2_MISSING_PRICE:
+                log_structured("L2_ERROR", {"symbol": symbol, "error": "missing_price", "is_bid": is_bid})
+                reported |= _L2_MISSING_PRICE
+            continue
+        try:
+            price_f = float(price)
+        except (TypeError, ValueError):
+            if not reported & _L2_PARSE_PRICE_ERROR:
+                log_structured("L2_ERROR", {"symbol": symbol, "error": "parse_price_error", "is_bid": is_bid})
+                reported |= _L2_PARSE_PRICE_ERROR
+            continue
+        if price_f <= 0:
+            if not reported & _L2_INVALID_PRICE:
+                log_structured("L2_ERROR", {"symbol": symbol, "error": "invalid_price", "price": price_f, "is_bid": is_bid})
+                reported |= _L2_INVALID_PRICE
+            continue
+        orders = level.get(orders_key)
+        if not orders:
+            log_structured("L2_ERROR", {"symbol": symbol, "error": f"no_orders in {'bid' if is_bid else 'ask'}"})
+            continue
+        for order in orders:
+            if not isinstance(order, dict):
+                log_structured("L2_ERROR", {"symbol": symbol, "error": f"invalid_order in {'bid' if is_bid else 'ask'}"})
+                continue
+            ex = order.get(ex_key) or ""
+            vid = _EX_ID.get(ex)
+            if vid is None and isinstance(ex, str):
+                # Rare: lowercase/mixed-case code from the feed.
+                vid = _EX_ID.get(ex.upper())
+            if vid is None:
+                log_structured("L2_ERROR", {"symbol": symbol, "error": "invalid_exchange", "exchange": ex})
+                continue
+            vol = order.get(vol_key)
+            try:
+                vol_i = _to_int(vol)
+            except (TypeError, ValueError):
+                log_structured("L2_ERROR", {"symbol": symbol, "error": f"parse_volume_error in {'bid' if is_bid else 'ask'}"})
+                continue
+            if vol_i <= 0:
+                log_structured("L2_ERROR", {"symbol": symbol, "error": f"invalid_volume in {'bid' if is_bid else 'ask'}"})
+                continue
+            prices.append(price_f)
+            sizes.append(vol_i)
+            venues.append(vid)
+    if DEBUG and prices:
+        log_structured("L2_DEBUG", {
+            "symbol": symbol,
+            "is_bid": is_bid,
+            "count": len(prices),
+            "exchanges": sorted({_EX_CODES[v] for v in venues}),
+            "top_price": max(prices),
+            "total_volume": sum(sizes)
+        })
+    return prices, sizes, venues, reported
+
+def _parse_side(entries, is_bid: bool, symbol: str, reported: int):
+    # The compiled parser returns None on anything malformed; the Python
+    # path then handles that side so errors are logged as usual. With
+    # --debug we always take the Python path for its L2_DEBUG lines.
+    if _book_ext is not None and not DEBUG and isinstance(entries, list):
+        side = _book_ext.parse_side(entries, _l2_keys(entries, is_bid), _EX_ID)
+        if side is not None:
+            return side, reported
+    prices, sizes, venues, reported = _parse_entries(entries, is_bid, symbol, reported)
+    return (np.array(prices, dtype=np.float64), np.array(sizes, dtype=np.int64),
+            np.array(venues, dtype=np.int16)), reported
 
 def _flatten_l2(it: dict) -> _Book:
-    out_bids: List[_Row] = []
-    out_asks: List[_Row] = []
     symbol = it.get("key", "UNKNOWN")
-    error_reported = {"missing_price": False, "parse_price_error": False, "invalid_price": False}
 
-    if DEBUG_BOOK_RAW and _book_raw_remaining[symbol] > 0:
-        _book_raw_remaining[symbol] -= 1
-        log_structured("BOOK_RAW", {"symbol": symbol, "payload": it})
+    if DEBUG_BOOK_RAW:
+        sid = SYM_ID.get(symbol)
+        if sid is not None and _book_raw_remaining[sid] > 0:
+            _book_raw_remaining[sid] -= 1
+            log_structured("BOOK_RAW", {"symbol": symbol, "payload": it})
 
     bids_src = it.get("2", []) or it.get("BIDS", []) or []
     asks_src = it.get("3", []) or it.get("ASKS", []) or []
 
-    def parse_entries(entries, is_bid: bool) -> List[_Row]:
-        result = []
-        if not isinstance(entries, list):
-            if not error_reported.get("invalid_level", False):
-                log_structured("L2_ERROR", {"symbol": symbol, "error": f"Non-list {'bids' if is_bid else 'asks'}"})
-                error_reported["invalid_level"] = True
-            return result
-        for level in entries:
-            if not isinstance(level, dict):
-                if not error_reported.get("invalid_level", False):
-                    log_structured("L2_ERROR", {"symbol": symbol, "error": f"Invalid {'bid' if is_bid else 'ask'} level"})
-                    error_reported["invalid_level"] = True
-                continue
-            price = level.get("0") or level.get("BID_PRICE" if is_bid else "ASK_PRICE")
-            if price is None:
-                if not error_reported["missing_price"]:
-                    log_structured("L2_ERROR", {"symbol": symbol, "error": "missing_price", "is_bid": is_bid})
-                    error_reported["missing_price"] = True
-                continue
-            try:
-                price_f = float(price)
-            except (TypeError, ValueError) as err:
-                if not error_reported["parse_price_error"]:
-                    log_structured("L2_ERROR", {"symbol": symbol, "error": "parse_price_error", "is_bid": is_bid})
-                    error_reported["parse_price_error"] = True
-                continue
-            if price_f <= 0:
-                if not error_reported["invalid_price"]:
-                    log_structured("L2_ERROR", {"symbol": symbol, "error": "invalid_price", "price": price_f, "is_bid": is_bid})
-                    error_reported["invalid_price"] = True
-                continue
-            orders = level.get("3", []) or level.get("BIDS" if is_bid else "ASKS", [])
-            if not orders:
-                log_structured("L2_ERROR", {"symbol": symbol, "error": f"no_orders in {'bid' if is_bid else 'ask'}"})
-                continue
-            for order in orders:
-                if not isinstance(order, dict):
-                    log_structured("L2_ERROR", {"symbol": symbol, "error": f"invalid_order in {'bid' if is_bid else 'ask'}"})
-                    continue
-                ex = (order.get("0") or order.get("EXCHANGE") or "").upper()
-                ex = "NASDAQ" if ex == "NSDQ" else ex
-                if not ex or ex not in EXCHANGE_MAP:
-                    log_structured("L2_ERROR", {"symbol": symbol, "error": "invalid_exchange", "exchange": ex})
-                    continue
-                vol = order.get("1") or order.get("BID_VOLUME" if is_bid else "ASK_VOLUME")
-                try:
-                    vol_i = int(float(vol))
-                except (TypeError, ValueError):
-                    log_structured("L2_ERROR", {"symbol": symbol, "error": f"parse_volume_error in {'bid' if is_bid else 'ask'}"})
-                    continue
-                if vol_i <= 0:
-                    log_structured("L2_ERROR", {"symbol": symbol, "error": f"invalid_volume in {'bid' if is_bid else 'ask'}"})
-                    continue
-                result.append({"EX": ex, "SIZE": vol_i, "PRICE": price_f})
-        if DEBUG and result:
-            log_structured("L2_DEBUG", {
-                "symbol": symbol,
-                "is_bid": is_bid,
-                "count": len(result),
-                "exchanges": sorted({r["EX"] for r in result}),
-                "top_price": max((r["PRICE"] for r in result), default=0.0),
-                "total_volume": sum(r["SIZE"] for r in result)
-            })
-        return result
-
-    out_bids.extend(parse_entries(bids_src, True))
-    out_asks.extend(parse_entries(asks_src, False))
-
-    top_bid = max((row["PRICE"] for row in out_bids), default=0.0)
-    top_ask = min((row["PRICE"] for row in out_asks), default=0.0)
-    total_bid_vol = sum(row["SIZE"] for row in out_bids)
-    total_ask_vol = sum(row["SIZE"] for row in out_asks)
-    log_structured("BOOK_SUMMARY", {
-        "symbol": symbol,
-        "top_bid": top_bid,
-        "top_ask": top_ask,
-        "bid_volume": total_bid_vol,
-        "ask_volume": total_ask_vol,
-        "spread_cents": (top_ask - top_bid) * 100.0 if top_bid and top_ask else 0.0
-    })
+    bid_side, reported = _parse_side(bids_src, True, symbol, 0)
+    ask_side, _ = _parse_side(asks_src, False, symbol, reported)
+    book = _Book(*bid_side, *ask_side)
+
     if DEBUG:
+        top_bid = float(book.bid_price.max()) if book.bid_price.size else 0.0
+        top_ask = float(book.ask_price.min()) if book.ask_price.size else 0.0
+        log_structured("BOOK_SUMMARY", {
+            "symbol": symbol,
+            "top_bid": top_bid,
+            "top_ask": top_ask,
+            "bid_volume": int(book.bid_size.sum()),
+            "ask_volume": int(book.ask_size.sum()),
+            "spread_cents": (top_ask - top_bid) * 100.0 if top_bid and top_ask else 0.0
+        })
+        bid_ex = {_EX_CODES[v] for v in book.bid_venue.tolist()}
+        ask_ex = {_EX_CODES[v] for v in book.ask_venue.tolist()}
         log_structured("EXCHANGE_DEBUG", {
             "symbol": symbol,
-            "bid_exchanges": sorted({row["EX"] for row in out_bids}),
-            "ask_exchanges": sorted({row["EX"] for row in out_asks}),
-            "total_exchanges": len(set(row["EX"] for row in out_bids) | set(row["EX"] for row in out_asks))
+            "bid_exchanges": sorted(bid_ex),
+            "ask_exchanges": sorted(ask_ex),
+            "total_exchanges": len(bid_ex | ask_ex)
         })
 
-    return {"BIDS": out_bids, "ASKS": out_asks}
+    return book
+
+# Alert thresholds are resolved once in main() into a frozen Config. The hot
+# handlers (on_book, process_book) get it passed in and copy the fields they
+# need into locals, so the per-tick checks don't hit module globals.
+@dataclass(frozen=True, slots=True)
+class Config:
+    window_seconds: int = 60
+    heartbeat_sec: int = 5
+    min_ask_heavy: int = 4
+    min_bid_heavy: int = 4
+    max_range_cents: int = 1
+    alert_throttle_sec: int = 60
+    min_volume: int = 100000
+    min_imbalance_duration_sec: float = 10.0
+    disable_bid_heavy: bool = False
+    book_coalesce_ms: int = 50
 
 @dataclass(frozen=True)
 class BookMetrics:
@@ -238,75 +370,119 @@ class BookMetrics:
     bid_to_ask_ratio: float
     ask_heavy_venues: int
     bid_heavy_venues: int
-    per_venue: Dict[str, tuple[int, int]]
+    per_venue: Dict[int, tuple[int, int]]  # venue id -> (bid size, ask size)
     valid_exchanges: int
+    top_bid: float = 0.0  # best bid/ask across every venue (0.0 if that side is empty)
+    top_ask: float = 0.0
+
+# Per-venue size totals and best prices (max bid / min ask) for one book,
+# written into caller-owned buffers: sums[0]/sums[1] are bid/ask sizes and
+# bounds[0]/bounds[1] are max bid / min ask per venue id.
+# _flatten_l2 already dropped non-positive sizes/prices, so every entry counts.
+# With numba installed the plain loop is compiled to native code; otherwise
+# the NumPy ufunc.at reductions do the same work in C.
+def _venue_totals_loop(bid_venue, bid_size, bid_price, ask_venue, ask_size, ask_price, sums, bounds):
+    sums[:] = 0
+    bounds[0, :] = -np.inf
+    bounds[1, :] = np.inf
+    for i in range(bid_venue.shape[0]):
+        v = bid_venue[i]
+        sums[0, v] += bid_size[i]
+        if bid_price[i] > bounds[0, v]:
+            bounds[0, v] = bid_price[i]
+    for i in range(ask_venue.shape[0]):
+        v = ask_venue[i]
+        sums[1, v] += ask_size[i]
+        if ask_price[i] < bounds[1, v]:
+            bounds[1, v] = ask_price[i]
+
+def _venue_totals_numpy(bid_venue, bid_size, bid_price, ask_venue, ask_size, ask_price, sums, bounds):
+    sums.fill(0)
+    bounds[0].fill(-np.inf)
+    bounds[1].fill(np.inf)
+    np.add.at(sums[0], bid_venue, bid_size)
+    np.add.at(sums[1], ask_venue, ask_size)
+    np.maximum.at(bounds[0], bid_venue, bid_price)
+    np.minimum.at(bounds[1], ask_venue, ask_price)
+
+_venue_totals = njit(cache=True, nogil=True)(_venue_totals_loop) if njit else _venue_totals_numpy
+
+# Per-symbol venue state carried across book updates. The accumulators are
+# double-buffered: each tick fills the spare pair and compares it with the
+# pair behind `metrics`. Schwab sends full snapshots, and many of them leave
+# every venue's size total and best price unchanged; those ticks reuse the
+# previous BookMetrics instead of rebuilding masks, totals and per_venue.
+@dataclass(slots=True)
+class _VenueState:
+    sums: np.ndarray    # (2, 2, N) int64: buffer, bid/ask, venue
+    bounds: np.ndarray  # (2, 2, N) float64: buffer, max bid/min ask, venue
+    cur: int = 0
+    metrics: Optional[BookMetrics] = None
+    max_range_cents: int = 0
+
+_VENUE_STATE: Dict[str, _VenueState] = {}
+
+def process_book(book: _Book, sym: str, cfg: Config) -> BookMetrics:
+    state = _VENUE_STATE.get(sym)
+    if state is None:
+        n_venues = len(_EX_CODES)
+        state = _VENUE_STATE[sym] = _VenueState(
+            np.zeros((2, 2, n_venues), np.int64), np.empty((2, 2, n_venues), np.float64))
+    nxt = state.cur ^ 1
+    sums, bounds = state.sums[nxt], state.bounds[nxt]
+    _venue_totals(
+        book.bid_venue, book.bid_size, book.bid_price,
+        book.ask_venue, book.ask_size, book.ask_price, sums, bounds,
+    )
+    prev = state.metrics
+    if (prev is not None and not DEBUG and state.max_range_cents == cfg.max_range_cents
+            and np.array_equal(sums, state.sums[state.cur])
+            and np.array_equal(bounds, state.bounds[state.cur])):
+        return prev
+    state.cur = nxt
+    bid_sums, ask_sums = sums
+    max_bid, min_ask = bounds
+
+    # A venue counts only if it quotes both sides within max_range_cents.
+    two_sided = np.isfinite(max_bid) & np.isfinite(min_ask)
+    spread_cents = np.where(two_sided, (min_ask - max_bid) * 100.0, np.inf)
+    valid = two_sided & (spread_cents <= cfg.max_range_cents)
 
-def process_book(book: _Book, sym: str) -> BookMetrics:
-    total_bids = 0
-    total_asks = 0
-    venue_cells: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
-    venue_prices: Dict[str, tuple[List[float], List[float]]] = defaultdict(lambda: ([], []))
-
-    for row in book.get("BIDS", []):
-        ex = row.get("EX", "UNK") or "UNK"
-        try:
-            size = int(row.get("SIZE", 0) or 0)
-            price = float(row.get("PRICE", 0) or 0)
-        except (TypeError, ValueError):
-            continue
-        if size > 0 and price > 0:
-            venue_cells[ex][0] += size
-            venue_prices[ex][0].append(price)
-
-    for row in book.get("ASKS", []):
-        ex = row.get("EX", "UNK") or "UNK"
-        try:
-            size = int(row.get("SIZE", 0) or 0)
-            price = float(row.get("PRICE", 0) or 0)
-        except (TypeError, ValueError):
-            continue
-        if size > 0 and price > 0:
-            venue_cells[ex][1] += size
-            venue_prices[ex][1].append(price)
-
-    valid_venues: Dict[str, tuple[int, int]] = {}
-    valid_exchanges = 0
-    for ex, (bid_sum, ask_sum) in venue_cells.items():
-        bid_prices, ask_prices = venue_prices[ex]
-        if DEBUG:
+    if DEBUG:
+        for vid in np.flatnonzero((bid_sums > 0) | (ask_sums > 0)):
+            bid_sum, ask_sum = int(bid_sums[vid]), int(ask_sums[vid])
             log_structured("VENUE_DEBUG", {
                 "symbol": sym,
-                "exchange": EXCHANGE_MAP.get(ex, ex),
+                "exchange": _EX_NAMES[vid],
                 "bid_sum": bid_sum,
                 "ask_sum": ask_sum,
-                "bid_prices": bid_prices,
-                "ask_prices": ask_prices
+                "bid_prices": book.bid_price[book.bid_venue == vid].tolist(),
+                "ask_prices": book.ask_price[book.ask_venue == vid].tolist()
             })
-        if bid_prices and ask_prices:
-            spread_cents = (min(ask_prices) - max(bid_prices)) * 100.0
-            if DEBUG:
+            if two_sided[vid]:
                 status = "ask-heavy" if ask_sum > bid_sum else "bid-heavy" if bid_sum > ask_sum else "balanced"
                 log_structured("SPREAD_DEBUG", {
                     "symbol": sym,
-                    "exchange": EXCHANGE_MAP.get(ex, ex),
-                    "spread_cents": spread_cents,
+                    "exchange": _EX_NAMES[vid],
+                    "spread_cents": float(spread_cents[vid]),
                     "bids": bid_sum,
                     "asks": ask_sum,
                     "status": status,
-                    "included": spread_cents <= MAX_RANGE_CENTS
+                    "included": bool(valid[vid])
                 })
-            if spread_cents <= MAX_RANGE_CENTS:
-                valid_venues[ex] = (bid_sum, ask_sum)
-                valid_exchanges += 1
-                total_bids += bid_sum
-                total_asks += ask_sum
-
-    ask_heavy = sum(1 for b, a in valid_venues.values() if a > b)
-    bid_heavy = sum(1 for b, a in valid_venues.values() if b > a)
+
+    valid_ids = np.flatnonzero(valid)
+    valid_venues: Dict[int, tuple[int, int]] = {
+        vid: (int(bid_sums[vid]), int(ask_sums[vid])) for vid in valid_ids.tolist()
+    }
+    total_bids = int(bid_sums[valid].sum())
+    total_asks = int(ask_sums[valid].sum())
+    ask_heavy = int(np.count_nonzero(valid & (ask_sums > bid_sums)))
+    bid_heavy = int(np.count_nonzero(valid & (bid_sums > ask_sums)))
     ask_to_bid_ratio = (total_asks / total_bids) if total_bids > 0 else float("inf")
     bid_to_ask_ratio = (total_bids / total_asks) if total_asks > 0 else float("inf")
 
-    return BookMetrics(
+    state.metrics = metrics = BookMetrics(
         symbol=sym,
         total_bids=total_bids,
         total_asks=total_asks,
@@ -315,47 +491,61 @@ def process_book(book: _Book, sym: str) -> BookMetrics:
         ask_heavy_venues=ask_heavy,
         bid_heavy_venues=bid_heavy,
         per_venue=valid_venues,
-        valid_exchanges=valid_exchanges,
+        valid_exchanges=len(valid_ids),
+        top_bid=float(max_bid.max()) if book.bid_price.size else 0.0,
+        top_ask=float(min_ask.min()) if book.ask_price.size else 0.0,
     )
+    state.max_range_cents = cfg.max_range_cents
+    return metrics
 
 # Trade Data Structures
 # Global knobs and rolling state that track how many heavy venues exist and
 # when an alert was last triggered. Most users only tweak the constants near
 # the top of this section.
-SYMBOLS: List[str] = []
-WINDOW_SECONDS: int = 60
-HEARTBEAT_SEC: int = 5
-MIN_ASK_HEAVY: int = 4
-MIN_BID_HEAVY: int = 4
-MAX_RANGE_CENTS: int = 1
-ALERT_THROTTLE_SEC: int = 60
-MIN_VOLUME: int = 100000
-MIN_IMBALANCE_DURATION_SEC: float = 10.0
+CFG: Config = Config()
+SYMBOLS: tuple = ()
+# Symbol -> small integer id (position in SYMBOLS). The per-tick state below
+# (trades, msg_count, _book_raw_remaining) lives in lists indexed by that id,
+# so handlers do one dict lookup on entry and plain list indexing after.
+SYM_ID: Dict[str, int] = {}
 DB_PATH: str = "penny_basing.db"
-DISABLE_BID_HEAVY: bool = False
 PRINTED_NO_INSTR: set = set()
 last_l1: Dict[str, dict] = {}
-trades: Dict[str, Deque] = {}
+trades: List["RingBuffer"] = []
 last_cum_volume: Dict[str, int] = defaultdict(int)
-msg_count: Dict[str, int] = {}
+msg_count: List[int] = []
 last_alert: Dict[str, float] = {}
-last_imbalance: Dict[str, Deque[tuple[float, str, BookMetrics]]] = defaultdict(lambda: deque(maxlen=200))
+# Direction of the current imbalance streak per symbol and the monotonic
+# times of its most recent directional ticks, so the persistence check in
+# on_book is O(1) instead of a history scan. Only the last
+# _STREAK_HISTORY_MAX ticks count toward a streak's duration, as with the
+# old 200-entry history.
+_STREAK_HISTORY_MAX = 200
+current_direction: Dict[str, str] = {}
+direction_ticks: Dict[str, Deque[float]] = {}
 _last_msg_ts: float = 0.0
 PRINT_EVERY: int = 20
 DEBUG_BOOK_RAW: bool = False
 JSON_BOOK: bool = False
 SHOW_BOOK: bool = False
 BOOK_INTERVAL_SEC: int = 2
-_book_raw_remaining: Dict[str, int] = defaultdict(lambda: 5)
-volume_window: Dict[str, Deque[int]] = defaultdict(lambda: deque(maxlen=10))
+# Per-symbol state below is filled in by _init_symbol_state() at startup
+# rather than through defaultdict lambda factories.
+_book_raw_remaining: List[int] = []
+volume_window: Dict[str, Deque[int]] = {}
 exchange_cache: Dict[str, Optional[str]] = {}
-alert_history: Dict[str, List[dict]] = defaultdict(list)
+alert_history: Dict[str, Deque[dict]] = {}
 DEBUG: bool = False
-_l1_debug_remaining: Dict[str, int] = defaultdict(lambda: 10)
-_chart_debug_remaining: Dict[str, int] = defaultdict(lambda: 10)
-_timesale_debug_remaining: Dict[str, int] = defaultdict(lambda: 10)
-_last_chart_or_timesale_ts: Dict[str, float] = defaultdict(float)
-_last_volume_fallback_ts: Dict[str, float] = defaultdict(float)
+_l1_debug_remaining: Dict[str, int] = {}
+_chart_debug_remaining: Dict[str, int] = {}
+_timesale_debug_remaining: Dict[str, int] = {}
+# time.monotonic() of the last CHART/TIMESALE print and of the last volume
+# fallback per symbol. A symbol with no entry has never seen one; reads use
+# _NEVER_TS rather than 0.0, which is only "long ago" once uptime passes the
+# staleness thresholds.
+_NEVER_TS = float("-inf")
+_last_chart_or_timesale_ts: Dict[str, float] = {}
+_last_volume_fallback_ts: Dict[str, float] = {}
 # Inline live trader hook
 # -----------------------
 # When grok writes a new alert to SQLite, it also forwards that alert directly
@@ -363,39 +553,281 @@ _last_volume_fallback_ts: Dict[str, float] = defaultdict(float)
 # avoids waiting for a separate polling script.
 inline_trader_dispatch = None
 inline_only_mode: bool = False
-inline_only_next_alert_id: int = 0
-
-@dataclass
-class Trade:
-    ts: float
-    px: float
-    sz: int
-
-def _touch():
-    global _last_msg_ts
-    _last_msg_ts = time()
-
-def _prune(sym: str, now_ts: float):
-    q = trades[sym]
-    cutoff = now_ts - WINDOW_SECONDS
-    while q and q[0].ts < cutoff:
-        q.popleft()
-
-def _summarize(sym: str, now: float):
-    q = trades[sym]
+# LiveTrader.process_alert runs on its own small thread pool (one thread per
+# inline worker) rather than the loop's default executor, which also serves
+# asyncio.to_thread calls such as the startup instrument lookups.
+_trader_executor: Optional[ThreadPoolExecutor] = None
+# Alert persistence
+# -----------------
+# Alert ids come from an in-memory counter seeded from MAX(rowid) at startup,
+# and rows are queued for _alert_writer_task, which commits them in batches
+# (up to ALERT_BATCH_MAX rows or ALERT_BATCH_WINDOW_SEC, whichever comes
+# first) instead of one fsync per alert. Both are tunable through
+# $ALERT_BATCH_MAX and $ALERT_BATCH_WINDOW_MS.
+last_alert_rowid: int = 0
+alert_write_queue: Optional[asyncio.Queue] = None
+ALERT_BATCH_MAX: int = 50
+ALERT_BATCH_WINDOW_SEC: float = 0.2
+_ALERT_INSERT_SQL = (
+    "INSERT INTO alerts (rowid, timestamp, symbol, ratio, total_bids, total_asks, heavy_venues, direction, price) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+# SQLite connections
+# ------------------
+# One autocommit writer (the alert batches) plus a few query_only readers that
+# executor threads borrow, e.g. the inline LiveTrader's price lookups, so no
+# alert or trade lookup reopens the .db/-wal/-shm files.
+_READ_PRAGMAS = (
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16384",  # 16 MB page cache
+    "PRAGMA mmap_size=268435456",  # 256 MB memory-mapped reads
+    "PRAGMA busy_timeout=5000",
+)
+
+class SqlitePool:
+    def __init__(self, path: str, readers: int = 4):
+        self.path = path
+        self.writer = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL lets readers (ui.py, paper/live traders) run alongside our writes,
+        # and synchronous=NORMAL only fsyncs at checkpoints instead of per commit.
+        self.writer.execute("PRAGMA journal_mode=WAL")
+        self.writer.execute("PRAGMA synchronous=NORMAL")
+        self.writer.execute("PRAGMA wal_autocheckpoint=1000")
+        for pragma in _READ_PRAGMAS:
+            self.writer.execute(pragma)
+        self._readers: SimpleQueue = SimpleQueue()
+        self._all_readers: List[sqlite3.Connection] = []
+        for _ in range(readers):
+            reader = sqlite3.connect(path, check_same_thread=False)
+            reader.row_factory = sqlite3.Row
+            reader.execute("PRAGMA query_only=1")
+            for pragma in _READ_PRAGMAS:
+                reader.execute(pragma)
+            self._all_readers.append(reader)
+            self._readers.put(reader)
+
+    @contextmanager
+    def borrow_reader(self):
+        # Blocks until a reader is free; callers run on executor threads.
+        reader = self._readers.get()
+        try:
+            yield reader
+        finally:
+            if reader.in_transaction:
+                reader.rollback()
+            self._readers.put(reader)
+
+    def close(self):
+        for reader in self._all_readers:
+            reader.close()
+        self.writer.close()
+
+pool: Optional[SqlitePool] = None
+
+# The alerts schema is versioned through PRAGMA user_version, so a normal
+# start is one pragma read plus a no-op CREATE TABLE IF NOT EXISTS. Older,
+# unversioned databases get any missing columns added in place rather than
+# the table being dropped. Version 2 adds the symbol index that LiveTrader's
+# per-symbol last-price lookup (MAX(rowid) GROUP BY symbol) walks instead of
+# scanning the whole table.
+ALERTS_SCHEMA_VERSION = 2
+_ALERT_COLUMNS = (
+    ("timestamp", "REAL"),
+    ("symbol", "TEXT"),
+    ("ratio", "REAL"),
+    ("total_bids", "INTEGER"),
+    ("total_asks", "INTEGER"),
+    ("heavy_venues", "INTEGER"),
+    ("direction", "TEXT"),
+    ("price", "REAL"),
+)
+
+_ALERTS_SYMBOL_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_alerts_symbol ON alerts(symbol)"
+
+def _ensure_alerts_schema(db: sqlite3.Connection):
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    db.execute("CREATE TABLE IF NOT EXISTS alerts (%s)" % ", ".join(f"{n} {t}" for n, t in _ALERT_COLUMNS))
+    if version >= ALERTS_SCHEMA_VERSION:
+        return
+    existing = {row[1] for row in db.execute("PRAGMA table_info(alerts)")}
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        for name, col_type in _ALERT_COLUMNS:
+            if name not in existing:
+                db.execute(f"ALTER TABLE alerts ADD COLUMN {name} {col_type}")
+        db.execute(_ALERTS_SYMBOL_INDEX_SQL)
+        db.execute(f"PRAGMA user_version={ALERTS_SCHEMA_VERSION}")
+        db.execute("COMMIT")
+    except sqlite3.Error:
+        db.execute("ROLLBACK")
+        raise
+conn: Optional[sqlite3.Connection] = None
+
+# Prints in the rolling window, stored as parallel ts/px/sz arrays with live
+# rows in [start:end). Pruning advances start and _summarize reduces the live
+# slices with NumPy instead of walking boxed tuples. When end reaches the
+# capacity the live rows are moved back to the front, or the arrays doubled
+# if the window itself is full.
+class RingBuffer:
+    __slots__ = ("ts", "px", "sz", "start", "end")
+
+    def __init__(self, capacity: int = 1 << 14):
+        self.ts = np.empty(capacity, np.float64)
+        self.px = np.empty(capacity, np.float64)
+        self.sz = np.empty(capacity, np.int64)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def append(self, ts: float, px: float, sz: int):
+        end = self.end
+        if end == len(self.ts):
+            n = end - self.start
+            if n == end:
+                self.ts = np.resize(self.ts, 2 * end)
+                self.px = np.resize(self.px, 2 * end)
+                self.sz = np.resize(self.sz, 2 * end)
+            else:
+                for arr in (self.ts, self.px, self.sz):
+                    arr[:n] = arr[self.start:end]
+                self.start, end = 0, n
+        self.ts[end] = ts
+        self.px[end] = px
+        self.sz[end] = sz
+        self.end = end + 1
+
+    def prune(self, cutoff: float):
+        # Same as popping from the left while the oldest print is before the
+        # cutoff; prints can arrive slightly out of order, so this stops at
+        # the first kept one rather than bisecting.
+        start, end = self.start, self.end
+        if start == end or self.ts[start] >= cutoff:
+            return
+        keep = self.ts[start:end] >= cutoff
+        self.start = start + int(keep.argmax()) if keep.any() else end
+
+    def clear(self):
+        self.start = self.end = 0
+
+# conn runs in autocommit mode (isolation_level=None), so the batch's
+# transaction is spelled out here rather than left to sqlite3's implicit BEGIN.
+# A batch that still hits "database is locked" after busy_timeout is retried
+# whole, up to _ALERT_WRITE_ATTEMPTS times. Any other error (e.g. a duplicate
+# rowid) falls back to one autocommit insert per row, so only the rows that
+# fail themselves are dropped rather than the whole batch.
+_ALERT_WRITE_ATTEMPTS = 3
+
+def _insert_alert_batch(rows: List[tuple]) -> None:
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(_ALERT_INSERT_SQL, rows)
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+def _write_alert_rows(rows: List[tuple]) -> None:
+    for attempt in range(1, _ALERT_WRITE_ATTEMPTS + 1):
+        try:
+            _insert_alert_batch(rows)
+            return
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e) and attempt < _ALERT_WRITE_ATTEMPTS:
+                continue
+            if "locked" in str(e):
+                log_structured("DB_ERROR", {"error": str(e), "attempts": attempt, "dropped_alerts": len(rows)})
+                return
+            batch_error = e
+            break
+        except sqlite3.Error as e:
+            batch_error = e
+            break
+    dropped = 0
+    for row in rows:
+        try:
+            conn.execute(_ALERT_INSERT_SQL, row)
+        except sqlite3.Error as e:
+            dropped += 1
+            log_structured("DB_ERROR", {"error": str(e), "alert_id": row[0]})
+    log_structured("DB_ERROR", {"error": str(batch_error), "batch": len(rows), "dropped_alerts": dropped})
+
+async def _alert_writer_task():
+    # Commits, including busy_timeout waits and the locked retries above, run
+    # on one dedicated thread so a contended batch never stalls the stream or
+    # book coalescing on the event loop. A single thread keeps batches in
+    # order on the one writer connection.
+    loop = asyncio.get_running_loop()
+    write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="alert-writer")
+    try:
+        while True:
+            rows: List[tuple] = []
+            try:
+                rows.append(await alert_write_queue.get())
+                deadline = loop.time() + ALERT_BATCH_WINDOW_SEC
+                while len(rows) < ALERT_BATCH_MAX:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        rows.append(await asyncio.wait_for(alert_write_queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # A half-collected batch is still written on cancellation.
+                if rows:
+                    write_executor.submit(_write_alert_rows, rows)
+                raise
+            await loop.run_in_executor(write_executor, _write_alert_rows, rows)
+    finally:
+        # Waits for the batch in flight so shutdown never closes the writer
+        # connection under a commit.
+        write_executor.shutdown(wait=True)
+
+def _drain_alert_queue():
+    rows = []
+    while alert_write_queue is not None and not alert_write_queue.empty():
+        rows.append(alert_write_queue.get_nowait())
+    if rows:
+        _write_alert_rows(rows)
+
+def _init_symbol_state(symbols: tuple, book_raw_limit: int = 5):
+    SYM_ID.clear()
+    SYM_ID.update((s, i) for i, s in enumerate(symbols))
+    n = len(symbols)
+    trades[:] = [RingBuffer() for _ in range(n)]
+    msg_count[:] = [0] * n
+    _book_raw_remaining[:] = [book_raw_limit] * n
+    for s in symbols:
+        volume_window[s] = deque(maxlen=10)
+        alert_history[s] = deque(maxlen=10)
+        _l1_debug_remaining[s] = 10
+        _chart_debug_remaining[s] = 10
+        _timesale_debug_remaining[s] = 10
+
+def _prune(sid: int, now_ts: float):
+    trades[sid].prune(now_ts - CFG.window_seconds)
+
+def _summarize(sym: str, sid: int, now: float):
+    q = trades[sid]
     if not q:
         log_structured("ROLL", {"symbol": sym, "message": "No prints yet"})
         return 0
-    hi = max(t.px for t in q)
-    lo = min(t.px for t in q)
-    vol = sum(t.sz for t in q)
+    px = q.px[q.start:q.end]
+    hi = float(px.max())
+    lo = float(px.min())
+    vol = int(q.sz[q.start:q.end].sum())
     volume_window[sym].append(vol)
     smoothed_vol = sum(volume_window[sym]) / len(volume_window[sym]) if volume_window[sym] else vol
-    window_duration = max(min(now - q[0].ts, WINDOW_SECONDS), 1.0) if q else WINDOW_SECONDS
+    window_seconds = CFG.window_seconds
+    window_duration = max(min(now - float(q.ts[q.start]), window_seconds), 1.0)
     vol_per_min = (smoothed_vol / (window_duration / 60)) if window_duration > 0 else 0
     log_structured("ROLL", {
         "symbol": sym,
-        "window_sec": WINDOW_SECONDS,
+        "window_sec": window_seconds,
         "high": hi,
         "low": lo,
         "range_cents": (hi - lo) * 100.0,
@@ -420,7 +852,7 @@ def _summarize(sym: str, now: float):
 def on_level1(msg: dict):
     for it in msg.get("content", []):
         sym = it.get("key")
-        if sym in SYMBOLS:
+        if sym in SYM_ID:
             if DEBUG and _l1_debug_remaining[sym] > 0:
                 _l1_debug_remaining[sym] -= 1
                 log_structured("L1_DEBUG", {"symbol": sym, "payload": it})
@@ -459,15 +891,18 @@ def on_level1(msg: dict):
                 continue
 
 def on_chart_equity(msg: dict):
+    global _last_msg_ts
     now = time()
+    mono = monotonic()
     for it in msg.get("content", []):
         sym = it.get("key")
-        if sym not in trades:
+        sid = SYM_ID.get(sym)
+        if sid is None:
             continue
         if DEBUG and _chart_debug_remaining[sym] > 0:
             _chart_debug_remaining[sym] -= 1
             log_structured("CHART_DEBUG", {"symbol": sym, "payload": it})
-        _last_chart_or_timesale_ts[sym] = now
+        _last_chart_or_timesale_ts[sym] = mono
         t_ms = it.get("CHART_TIME", it.get("TIME"))
         try:
             ts = (float(t_ms) / 1000.0) if t_ms is not None else now
@@ -491,35 +926,38 @@ def on_chart_equity(msg: dict):
         if delta < 0:
             log_structured("CHART_WARNING", {"symbol": sym, "message": "Negative volume delta, resetting", "cum_volume": cum, "prev_volume": prev})
             last_cum_volume[sym] = cum
-            trades[sym].clear()
+            trades[sid].clear()
             volume_window[sym].clear()
             continue
         last_cum_volume[sym] = cum
         if delta > 0:
-            trades[sym].append(Trade(ts, px, delta))
-            _prune(sym, ts)
-            _touch()
-            msg_count[sym] += 1
+            trades[sid].append(ts, px, delta)
+            _prune(sid, ts)
+            _last_msg_ts = mono
+            msg_count[sid] += 1
             if DEBUG:
                 log_structured("CHART_VOLUME_DEBUG", {
                     "symbol": sym,
                     "cum_volume": cum,
                     "delta_volume": delta,
-                    "trade_count": len(trades[sym])
+                    "trade_count": len(trades[sid])
                 })
-            if msg_count[sym] % PRINT_EVERY == 0:
-                _summarize(sym, now)
+            if msg_count[sid] % PRINT_EVERY == 0:
+                _summarize(sym, sid, now)
 
 def on_timesale(msg: dict):
+    global _last_msg_ts
     now = time()
+    mono = monotonic()
     for it in msg.get("content", []):
         sym = it.get("key")
-        if sym not in trades:
+        sid = SYM_ID.get(sym)
+        if sid is None:
             continue
         if DEBUG and _timesale_debug_remaining[sym] > 0:
             _timesale_debug_remaining[sym] -= 1
             log_structured("TIMESALE_DEBUG", {"symbol": sym, "payload": it})
-        _last_chart_or_timesale_ts[sym] = now
+        _last_chart_or_timesale_ts[sym] = mono
         px_val = it.get("LAST_PRICE", it.get("PRICE"))
         sz_val = it.get("LAST_SIZE", it.get("TRADE_SIZE", 0))
         t_ms = it.get("TRADE_TIME", it.get("TIME"))
@@ -531,69 +969,117 @@ def on_timesale(msg: dict):
             log_structured("TIMESALE_ERROR", {"symbol": sym, "error": "Invalid price or size", "price": px_val, "size": sz_val})
             continue
         if sz > 0:
-            trades[sym].append(Trade(ts, px, sz))
-            _prune(sym, ts)
-            _touch()
-            msg_count[sym] += 1
+            trades[sid].append(ts, px, sz)
+            _prune(sid, ts)
+            _last_msg_ts = mono
+            msg_count[sid] += 1
             if DEBUG:
                 log_structured("TIMESALE_VOLUME_DEBUG", {
                     "symbol": sym,
                     "trade_size": sz,
-                    "trade_count": len(trades[sym])
+                    "trade_count": len(trades[sid])
                 })
-            if msg_count[sym] % PRINT_EVERY == 0:
-                _summarize(sym, now)
-
-def on_book(msg: dict):
-    global _last_msg_ts
+            if msg_count[sid] % PRINT_EVERY == 0:
+                _summarize(sym, sid, now)
+
+# Book coalescing
+# ---------------
+# Schwab often sends several book updates for a symbol within a few ms, and
+# the imbalance check only cares about the latest one. on_book evaluates a
+# symbol right away when it has been quiet for book_coalesce_ms; updates that
+# arrive inside that window park in pending_book and _book_coalesce_task
+# evaluates only the newest one when the window closes.
+pending_book: Dict[str, dict] = {}
+_last_book_eval: Dict[str, float] = {}
+_book_wake: Optional[asyncio.Event] = None
+
+def on_book(msg: dict, cfg: Config):
     now = time()
+    mono = monotonic()
+    window = cfg.book_coalesce_ms / 1000.0
     for it in msg.get("content", []):
         sym = it.get("key")
-        if sym not in SYMBOLS:
+        if sym not in SYM_ID:
             continue
-        book = _flatten_l2(it)
-        metrics = process_book(book, sym)
-        _last_msg_ts = now
-        price = last_l1.get(sym, {}).get("LAST_PRICE", 0.0)
-        bid_price = max((b.get("PRICE", 0) for b in book["BIDS"]), default=0.0)
-        ask_price = min((a.get("PRICE", 0) for a in book["ASKS"]), default=0.0)
-        if not price and bid_price and ask_price:
-            price = (bid_price + ask_price) / 2
-            log_structured("PRICE_FALLBACK", {
-                "symbol": sym,
-                "bid_price": bid_price,
-                "ask_price": ask_price,
-                "midpoint": price
-            })
-        elif not price:
-            log_structured("PRICE_FALLBACK_ERROR", {
-                "symbol": sym,
-                "bid_price": bid_price,
-                "ask_price": ask_price
-            })
-        q = trades.get(sym, deque())
-        vol_per_min = 0
-        if (now - _last_chart_or_timesale_ts[sym]) > 30.0:
-            log_structured("NO_DATA_WARNING", {
+        if _book_wake is None or mono - _last_book_eval.get(sym, 0.0) >= window:
+            pending_book.pop(sym, None)
+            _evaluate_book(it, sym, now, mono, cfg)
+        else:
+            pending_book[sym] = it
+            _book_wake.set()
+
+async def _book_coalesce_task(cfg: Config):
+    global pending_book
+    window = cfg.book_coalesce_ms / 1000.0
+    while True:
+        await _book_wake.wait()
+        await asyncio.sleep(window)
+        _book_wake.clear()
+        batch, pending_book = pending_book, {}
+        now = time()
+        mono = monotonic()
+        for sym, it in batch.items():
+            try:
+                _evaluate_book(it, sym, now, mono, cfg)
+            except Exception as e:
+                log_structured("BOOK_ERROR", {"symbol": sym, "error": str(e)})
+
+# `now` is wall-clock time for trade/alert timestamps; `mono` is
+# time.monotonic() for elapsed-time checks (throttles, streaks, staleness),
+# so those don't jump when the system clock is adjusted.
+def _evaluate_book(it: dict, sym: str, now: float, mono: float, cfg: Config):
+    global _last_msg_ts, last_alert_rowid
+    _last_book_eval[sym] = mono
+    window_seconds = cfg.window_seconds
+    disable_bid_heavy = cfg.disable_bid_heavy
+    min_imbalance_duration = cfg.min_imbalance_duration_sec
+    min_heavy = max(cfg.min_ask_heavy, cfg.min_bid_heavy)
+    min_volume = cfg.min_volume
+    alert_throttle = cfg.alert_throttle_sec
+    metrics = process_book(_flatten_l2(it), sym, cfg)
+    _last_msg_ts = mono
+    price = last_l1.get(sym, {}).get("LAST_PRICE", 0.0)
+    bid_price = metrics.top_bid
+    ask_price = metrics.top_ask
+    if not price and bid_price and ask_price:
+        price = (bid_price + ask_price) / 2
+        log_structured("PRICE_FALLBACK", {
+            "symbol": sym,
+            "bid_price": bid_price,
+            "ask_price": ask_price,
+            "midpoint": price
+        })
+    elif not price:
+        log_structured("PRICE_FALLBACK_ERROR", {
+            "symbol": sym,
+            "bid_price": bid_price,
+            "ask_price": ask_price
+        })
+    sid = SYM_ID[sym]
+    q = trades[sid]
+    vol_per_min = 0
+    if (mono - _last_chart_or_timesale_ts.get(sym, _NEVER_TS)) > 30.0:
+        log_structured("NO_DATA_WARNING", {
+            "symbol": sym,
+            "message": "No CHART_EQUITY or TIMESALE_EQUITY data for 30s"
+        })
+        if (mono - _last_volume_fallback_ts.get(sym, _NEVER_TS)) >= 10.0:
+            est_volume = (metrics.total_bids + metrics.total_asks) // 2
+            est_volume_per_min = (est_volume / (window_seconds / 60)) if est_volume > 0 else 0
+            trades[sid].append(now, price or bid_price or ask_price or 0.0, est_volume)
+            _last_volume_fallback_ts[sym] = mono
+            _prune(sid, now)
+            log_structured("VOLUME_FALLBACK", {
                 "symbol": sym,
-                "message": "No CHART_EQUITY or TIMESALE_EQUITY data for 30s"
+                "est_volume": est_volume,
+                "vol_per_min": est_volume_per_min
             })
-            if (now - _last_volume_fallback_ts[sym]) >= 10.0:
-                est_volume = (metrics.total_bids + metrics.total_asks) // 2
-                est_volume_per_min = (est_volume / (WINDOW_SECONDS / 60)) if est_volume > 0 else 0
-                trades[sym].append(Trade(now, price or bid_price or ask_price or 0.0, est_volume))
-                _last_volume_fallback_ts[sym] = now
-                _prune(sym, now)
-                log_structured("VOLUME_FALLBACK", {
-                    "symbol": sym,
-                    "est_volume": est_volume,
-                    "vol_per_min": est_volume_per_min
-                })
-                vol_per_min = _summarize(sym, now)
-            else:
-                vol_per_min = _summarize(sym, now) if q else 0
+            vol_per_min = _summarize(sym, sid, now)
         else:
-            vol_per_min = _summarize(sym, now) if q else 0
+            vol_per_min = _summarize(sym, sid, now) if q else 0
+    else:
+        vol_per_min = _summarize(sym, sid, now) if q else 0
+    if DEBUG:
         log_structured("IMBALANCE_DEBUG", {
             "symbol": sym,
             "ask_heavy": metrics.ask_heavy_venues,
@@ -604,82 +1090,72 @@ def on_book(msg: dict):
             "vol_per_min": vol_per_min,
             "price": price
         })
-        direction = None
-        if not DISABLE_BID_HEAVY and metrics.bid_heavy_venues >= metrics.ask_heavy_venues + 4:
-            direction = "bid-heavy"
-        elif metrics.ask_heavy_venues >= metrics.bid_heavy_venues + 4:
-            direction = "ask-heavy"
-        if direction:
-            last_imbalance[sym].append((now, direction, metrics))
-            # Check if the imbalance has persisted for at least MIN_IMBALANCE_DURATION_SEC
-            imbalance_duration = 0.0
-            if last_imbalance[sym]:
-                first_ts = None
-                for ts, dir, _ in reversed(last_imbalance[sym]):
-                    if dir != direction:
-                        break
-                    first_ts = ts
-                if first_ts is not None:
-                    imbalance_duration = now - first_ts
-            if DEBUG:
-                log_structured("DIRECTION_DEBUG", {
-                    "symbol": sym,
-                    "direction": direction,
-                    "bid_heavy_venues": metrics.bid_heavy_venues,
-                    "ask_heavy_venues": metrics.ask_heavy_venues,
-                    "imbalance_duration": round(imbalance_duration, 2)
-                })
-            if (imbalance_duration >= MIN_IMBALANCE_DURATION_SEC and
-                metrics.valid_exchanges >= max(MIN_ASK_HEAVY, MIN_BID_HEAVY) and 
-                vol_per_min >= MIN_VOLUME and
-                (sym not in last_alert or (now - last_alert[sym]) >= ALERT_THROTTLE_SEC)):
-                ratio = metrics.ask_to_bid_ratio if direction == "ask-heavy" else metrics.bid_to_ask_ratio
-                heavy_venues = metrics.ask_heavy_venues if direction == "ask-heavy" else metrics.bid_heavy_venues
-                alert = {
-                    "timestamp": now,
-                    "symbol": sym,
-                    "ratio": ratio,
-                    "total_bids": metrics.total_bids,
-                    "total_asks": metrics.total_asks,
-                    "heavy_venues": heavy_venues,
-                    "direction": direction,
-                    "price": price,
-                    "exchanges": [EXCHANGE_MAP.get(ex, ex) for ex in metrics.per_venue.keys()]
-                }
-                alert_history[sym].append(alert)
-                if len(alert_history[sym]) > 10:
-                    alert_history[sym].pop(0)
-                global inline_only_next_alert_id
-                if inline_only_mode:
-                    inline_only_next_alert_id += 1
-                    next_alert_id = inline_only_next_alert_id
-                else:
-                    c = conn.cursor()
-                    c.execute("SELECT IFNULL(MAX(rowid), 0) FROM alerts")
-                    next_alert_id = (c.fetchone() or [0])[0] + 1
-                inline_ok = True
-                if inline_trader_dispatch:
-                    inline_ok = inline_trader_dispatch(next_alert_id, alert)
-                if not inline_only_mode or not inline_ok:
-                    c.execute(
-                        "INSERT INTO alerts (rowid, timestamp, symbol, ratio, total_bids, total_asks, heavy_venues, direction, price) "
-                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                        (next_alert_id, alert["timestamp"], alert["symbol"], alert["ratio"], alert["total_bids"],
-                         alert["total_asks"], alert["heavy_venues"], alert["direction"], alert["price"])
-                    )
-                    conn.commit()
-                last_alert[sym] = now
-                log_structured("ALERT", {
-                    "symbol": sym,
-                    "direction": direction,
-                    "ratio": round(ratio, 2),
-                    "venues": heavy_venues,
-                    "bids": metrics.total_bids,
-                    "asks": metrics.total_asks,
-                    "price": round(price, 4),
-                    "vol_per_min": round(vol_per_min, 2),
-                    "imbalance_duration": round(imbalance_duration, 2)
-                })
+    direction = None
+    if not disable_bid_heavy and metrics.bid_heavy_venues >= metrics.ask_heavy_venues + 4:
+        direction = "bid-heavy"
+    elif metrics.ask_heavy_venues >= metrics.bid_heavy_venues + 4:
+        direction = "ask-heavy"
+    if direction:
+        # Check if the imbalance has persisted for at least min_imbalance_duration_sec.
+        # Neutral books don't break a streak; only a flip to the other side does.
+        streak = direction_ticks.get(sym)
+        if streak is None:
+            streak = direction_ticks[sym] = deque(maxlen=_STREAK_HISTORY_MAX)
+        if direction != current_direction.get(sym):
+            current_direction[sym] = direction
+            streak.clear()
+        streak.append(mono)
+        imbalance_duration = mono - streak[0]
+        if DEBUG:
+            log_structured("DIRECTION_DEBUG", {
+                "symbol": sym,
+                "direction": direction,
+                "bid_heavy_venues": metrics.bid_heavy_venues,
+                "ask_heavy_venues": metrics.ask_heavy_venues,
+                "imbalance_duration": round(imbalance_duration, 2)
+            })
+        if (imbalance_duration >= min_imbalance_duration and
+            metrics.valid_exchanges >= min_heavy and
+            vol_per_min >= min_volume and
+            (sym not in last_alert or (mono - last_alert[sym]) >= alert_throttle)):
+            ratio = metrics.ask_to_bid_ratio if direction == "ask-heavy" else metrics.bid_to_ask_ratio
+            heavy_venues = metrics.ask_heavy_venues if direction == "ask-heavy" else metrics.bid_heavy_venues
+            alert = {
+                "timestamp": now,
+                "symbol": sym,
+                "ratio": ratio,
+                "total_bids": metrics.total_bids,
+                "total_asks": metrics.total_asks,
+                "heavy_venues": heavy_venues,
+                "direction": direction,
+                "price": price,
+                "exchanges": [_EX_NAMES[vid] for vid in metrics.per_venue]
+            }
+            alert_history[sym].append(alert)
+            last_alert_rowid += 1
+            next_alert_id = last_alert_rowid
+            inline_ok = True
+            if inline_trader_dispatch:
+                inline_ok = inline_trader_dispatch(next_alert_id, alert)
+            if not inline_only_mode or not inline_ok:
+                # Row tuple in _ALERT_INSERT_SQL column order, built from the
+                # locals rather than read back out of the alert dict.
+                alert_write_queue.put_nowait(
+                    (next_alert_id, now, sym, ratio, metrics.total_bids,
+                     metrics.total_asks, heavy_venues, direction, price)
+                )
+            last_alert[sym] = mono
+            log_structured("ALERT", {
+                "symbol": sym,
+                "direction": direction,
+                "ratio": round(ratio, 2),
+                "venues": heavy_venues,
+                "bids": metrics.total_bids,
+                "asks": metrics.total_asks,
+                "price": round(price, 4),
+                "vol_per_min": round(vol_per_min, 2),
+                "imbalance_duration": round(imbalance_duration, 2)
+            })
 
 async def resolve_exchange(client: Client, sym: str) -> Optional[str]:
     if sym in exchange_cache:
@@ -689,7 +1165,12 @@ async def resolve_exchange(client: Client, sym: str) -> Optional[str]:
         if get_instruments is None:
             raise RuntimeError("Client missing get_instruments")
 
-        instruments = get_instruments([sym], projection="fundamental")
+        if asyncio.iscoroutinefunction(get_instruments):
+            instruments = await get_instruments([sym], projection="fundamental")
+        else:
+            # The default easy_client is synchronous; run the request on a
+            # thread so lookups for several symbols overlap under gather().
+            instruments = await asyncio.to_thread(get_instruments, [sym], projection="fundamental")
         if asyncio.iscoroutine(instruments):
             instruments = await instruments
         if hasattr(instruments, "json"):
@@ -721,16 +1202,34 @@ async def _book_monitor_task():
         log_structured("BOOK_MONITOR", {"message": "Monitoring book updates"})
         await asyncio.sleep(BOOK_INTERVAL_SEC)
 
+# Reconnect after this long without a stream message; checked every
+# STREAM_WATCHDOG_SEC.
+STREAM_IDLE_TIMEOUT_SEC: float = 30.0
+STREAM_WATCHDOG_SEC: float = 5.0
+
 async def _heartbeat_task():
-    start = time()
     while True:
-        now = time()
-        age = (now - _last_msg_ts) if _last_msg_ts else float("inf")
+        age = (monotonic() - _last_msg_ts) if _last_msg_ts else float("inf")
         if age == float("inf"):
             log_structured("HEARTBEAT", {"status": "alive", "message": "No market data yet"})
         else:
             log_structured("HEARTBEAT", {"status": "alive", "last_data_age": round(age, 2)})
-        await asyncio.sleep(HEARTBEAT_SEC)
+        await asyncio.sleep(CFG.heartbeat_sec)
+
+# grok keeps one connection open all session, so refresh planner stats
+# periodically (and once more at shutdown) instead of only on restart.
+DB_OPTIMIZE_INTERVAL_SEC: int = 4 * 3600
+
+def _optimize_db():
+    try:
+        conn.execute("PRAGMA optimize")
+    except sqlite3.Error as e:
+        log_structured("DB_ERROR", {"error": str(e), "action": "optimize"})
+
+async def _db_optimize_task():
+    while True:
+        await asyncio.sleep(DB_OPTIMIZE_INTERVAL_SEC)
+        _optimize_db()
 
 # Main function
 async def main():
@@ -750,6 +1249,7 @@ async def main():
     parser.add_argument("--show-book", action="store_true", help="Show book updates.")
     parser.add_argument("--book-interval", type=int, help="Book print interval seconds (overrides $BOOK_INTERVAL_SEC).")
     parser.add_argument("--json-book", action="store_true", help="Show book as JSON.")
+    parser.add_argument("--book-coalesce-ms", type=int, help="Coalesce L2 updates per symbol within this many ms; 0 evaluates every update (overrides $BOOK_COALESCE_MS).")
     parser.add_argument("--debug-instr", action="store_true", help="Debug: print instrument lookups.")
     parser.add_argument("--debug-book-raw", action="store_true", help="Debug: print raw book payloads.")
     parser.add_argument("--book-raw-limit", type=int, help="How many raw L2 payloads to print when --debug-book-raw is set (default 5).")
@@ -758,12 +1258,14 @@ async def main():
     args = parser.parse_args()
 
     load_dotenv()
+    global _ENV
+    _ENV = os.environ.copy()
 
-    api_key = os.getenv("SCHWAB_CLIENT_ID")
-    app_secret = os.getenv("SCHWAB_APP_SECRET")
-    redirect_uri = os.getenv("SCHWAB_REDIRECT_URI")
-    token_path = os.getenv("SCHWAB_TOKEN_PATH", "./schwab_tokens.json")
-    account_id_s = os.getenv("SCHWAB_ACCOUNT_ID")
+    api_key = _ENV.get("SCHWAB_CLIENT_ID")
+    app_secret = _ENV.get("SCHWAB_APP_SECRET")
+    redirect_uri = _ENV.get("SCHWAB_REDIRECT_URI")
+    token_path = _ENV.get("SCHWAB_TOKEN_PATH", "./schwab_tokens.json")
+    account_id_s = _ENV.get("SCHWAB_ACCOUNT_ID")
 
     if not api_key or not app_secret or not redirect_uri or not account_id_s:
         missing = [k for k, v in {
@@ -787,76 +1289,70 @@ async def main():
         log_structured("CONFIG_ERROR", {"error": "SCHWAB_ACCOUNT_ID must be an integer"})
         sys.exit(2)
 
-    global WINDOW_SECONDS, HEARTBEAT_SEC, MIN_ASK_HEAVY, MIN_BID_HEAVY
-    global MAX_RANGE_CENTS, ALERT_THROTTLE_SEC, MIN_VOLUME, MIN_IMBALANCE_DURATION_SEC
-    global DB_PATH, SYMBOLS, DISABLE_BID_HEAVY, trades, msg_count, _book_raw_remaining
+    global CFG, DB_PATH, SYMBOLS
     global DEBUG_BOOK_RAW, JSON_BOOK, SHOW_BOOK, BOOK_INTERVAL_SEC, DEBUG_INSTR, DEBUG
 
-    WINDOW_SECONDS = args.window if args.window is not None else _get_int_env("WINDOW_SECONDS", 60, 30)
-    HEARTBEAT_SEC = args.heartbeat if args.heartbeat is not None else _get_int_env("HEARTBEAT_SEC", 5, 1)
-    MIN_ASK_HEAVY = args.min_venues if args.min_venues is not None else _get_int_env("MIN_ASK_HEAVY", 4, 1)
-    MIN_BID_HEAVY = args.min_venues if args.min_venues is not None else _get_int_env("MIN_BID_HEAVY", 4, 1)
-    MAX_RANGE_CENTS = args.max_range if args.max_range is not None else _get_int_env("MAX_RANGE_CENTS", 1, 1)
-    ALERT_THROTTLE_SEC = args.throttle if args.throttle is not None else _get_int_env("ALERT_THROTTLE_SEC", 60, 10)
-    MIN_VOLUME = args.min_volume if args.min_volume is not None else _get_int_env("MIN_VOLUME", 100000, 1000)
-    MIN_IMBALANCE_DURATION_SEC = args.min_imbalance_duration if args.min_imbalance_duration is not None else _get_float_env("MIN_IMBALANCE_DURATION_SEC", 10.0, 0.0)
-    DB_PATH = args.db_path if args.db_path is not None else os.getenv("DB_PATH", "penny_basing.db")
+    CFG = Config(
+        window_seconds=args.window if args.window is not None else _get_int_env("WINDOW_SECONDS", 60, 30),
+        heartbeat_sec=args.heartbeat if args.heartbeat is not None else _get_int_env("HEARTBEAT_SEC", 5, 1),
+        min_ask_heavy=args.min_venues if args.min_venues is not None else _get_int_env("MIN_ASK_HEAVY", 4, 1),
+        min_bid_heavy=args.min_venues if args.min_venues is not None else _get_int_env("MIN_BID_HEAVY", 4, 1),
+        max_range_cents=args.max_range if args.max_range is not None else _get_int_env("MAX_RANGE_CENTS", 1, 1),
+        alert_throttle_sec=args.throttle if args.throttle is not None else _get_int_env("ALERT_THROTTLE_SEC", 60, 10),
+        min_volume=args.min_volume if args.min_volume is not None else _get_int_env("MIN_VOLUME", 100000, 1000),
+        min_imbalance_duration_sec=(args.min_imbalance_duration if args.min_imbalance_duration is not None
+                                    else _get_float_env("MIN_IMBALANCE_DURATION_SEC", 10.0, 0.0)),
+        disable_bid_heavy=bool(args.disable_bid_heavy),
+        book_coalesce_ms=(args.book_coalesce_ms if args.book_coalesce_ms is not None
+                          else _get_int_env("BOOK_COALESCE_MS", 50, 0)),
+    )
+    DB_PATH = args.db_path if args.db_path is not None else _ENV.get("DB_PATH", "penny_basing.db")
     os.environ["DB_PATH"] = str(DB_PATH)
     inline_only_requested = _bool_env("INLINE_DISPATCH_ONLY", False)
     # if args.symbols:
     #     SYMBOLS = [s.strip().upper() for s in args.symbols.replace(" ", ",").split(",") if s.strip()]
     # else:
-    SYMBOLS = _parse_symbols_from_env("SYMBOLS", "F")
-    DISABLE_BID_HEAVY = bool(args.disable_bid_heavy)
+    SYMBOLS = tuple(sys.intern(s) for s in _parse_symbols_from_env("SYMBOLS", "F"))
     DEBUG_BOOK_RAW = bool(args.debug_book_raw)
     JSON_BOOK = bool(args.json_book)
     SHOW_BOOK = bool(args.show_book)
     BOOK_INTERVAL_SEC = args.book_interval if args.book_interval is not None else _get_int_env("BOOK_INTERVAL_SEC", 2, 1)
-    _book_raw_remaining = defaultdict(lambda: args.book_raw_limit if args.book_raw_limit is not None else _get_int_env("BOOK_RAW_LIMIT", 5, 1))
-    DEBUG_INSTR = bool(args.debug_instr) or any(sym in {"CRON", "F"} for sym in SYMBOLS)
+    DEBUG_INSTR = bool(args.debug_instr) or any(sym in _HARDCODED_EX for sym in SYMBOLS)
     DEBUG = bool(args.debug)
 
     if not SYMBOLS:
         log_structured("CONFIG_ERROR", {"error": "No symbols provided"})
         sys.exit(2)
 
-    trades = {s: deque() for s in SYMBOLS}
-    msg_count = {s: 0 for s in SYMBOLS}
+    global ALERT_BATCH_MAX, ALERT_BATCH_WINDOW_SEC
+    ALERT_BATCH_MAX = _get_int_env("ALERT_BATCH_MAX", 50, 1)
+    ALERT_BATCH_WINDOW_SEC = _get_int_env("ALERT_BATCH_WINDOW_MS", 200, 0) / 1000.0
+    _init_symbol_state(SYMBOLS, args.book_raw_limit if args.book_raw_limit is not None else _get_int_env("BOOK_RAW_LIMIT", 5, 1))
 
     Path(DB_PATH).parent.mkdir(parents=True, exist_ok=True)
-    global conn, inline_only_next_alert_id
-    conn = sqlite3.connect(DB_PATH)
+    global pool, conn, last_alert_rowid, alert_write_queue, _book_wake
+    pool = SqlitePool(DB_PATH)
+    conn = pool.writer
     c = conn.cursor()
-    c.execute("PRAGMA table_info(alerts)")
-    columns = [info[1] for info in c.fetchall()]
-    required_columns = {"timestamp", "symbol", "ratio", "total_bids", "total_asks", "heavy_venues", "direction", "price"}
-    if not all(col in columns for col in required_columns):
-        c.execute("DROP TABLE IF EXISTS alerts")
-        c.execute('''
-            CREATE TABLE alerts (
-                timestamp REAL,
-                symbol TEXT,
-                ratio REAL,
-                total_bids INTEGER,
-                total_asks INTEGER,
-                heavy_venues INTEGER,
-                direction TEXT,
-                price REAL
-            )
-        ''')
-    inline_only_next_alert_id = (c.execute("SELECT IFNULL(MAX(rowid), 0) FROM alerts").fetchone() or [0])[0]
-    conn.commit()
-
-    global inline_trader_dispatch, inline_only_mode
+    _ensure_alerts_schema(conn)
+    last_alert_rowid = (c.execute("SELECT IFNULL(MAX(rowid), 0) FROM alerts").fetchone() or [0])[0]
+    alert_write_queue = asyncio.Queue()
+    writer_task = asyncio.create_task(_alert_writer_task())
+
+    global inline_trader_dispatch, inline_only_mode, _trader_executor
     inline_trader_dispatch = None
     inline_only_mode = False
+    inline_trader = None
     try:
         from live_trader import LiveTrader
 
-        inline_trader = LiveTrader(dry_run=_bool_env("INLINE_LIVE_DRY_RUN", False))
+        inline_trader = LiveTrader(
+            dry_run=_bool_env("INLINE_LIVE_DRY_RUN", False), reader=pool.borrow_reader
+        )
         loop = asyncio.get_running_loop()
         queue: asyncio.Queue = asyncio.Queue(maxsize=_get_int_env("INLINE_TRADER_QUEUE", 100, 10))
         worker_count = _get_int_env("INLINE_TRADER_WORKERS", 1, 1)
+        _trader_executor = ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="trader")
         inline_queue_drops = 0
 
         async def _inline_worker() -> None:
@@ -867,7 +1363,7 @@ async def main():
                     if lag > 0.5:
                         log_structured("INLINE_TRADER_LAG", {"alert_id": alert_id, "lag_sec": round(lag, 3)})
                     await loop.run_in_executor(
-                        None,
+                        _trader_executor,
                         inline_trader.process_alert,
                         int(alert_id),
                         alert["symbol"],
@@ -923,6 +1419,8 @@ async def main():
         sys.exit(3)
 
     stream = StreamClient(client, account_id=account_id)
+    if orjson:
+        stream.set_json_decoder(_OrjsonStreamDecoder())
 
     stream.add_level_one_equity_handler(on_level1)
     has_ts = hasattr(stream, "add_timesale_equity_handler") and hasattr(stream, "timesale_equity_subs")
@@ -930,8 +1428,9 @@ async def main():
         stream.add_timesale_equity_handler(on_timesale)
     else:
         stream.add_chart_equity_handler(on_chart_equity)
-    stream.add_nasdaq_book_handler(on_book)
-    stream.add_nyse_book_handler(on_book)
+    book_handler = partial(on_book, cfg=CFG)
+    stream.add_nasdaq_book_handler(book_handler)
+    stream.add_nyse_book_handler(book_handler)
 
     async def connect_with_retries(max_attempts: int = 3):
         for attempt in range(1, max_attempts + 1):
@@ -951,94 +1450,149 @@ async def main():
         log_structured("SUBS_ERROR", {"error": "Failed to establish stream connection"})
         sys.exit(4)
 
+    # schwab-py has renamed the QoS setter across versions; pick it once.
+    set_qos = (getattr(stream, "quality_of_service", None)
+               or getattr(stream, "set_quality_of_service", None)
+               or getattr(stream, "set_qos", None))
     try:
-        if hasattr(stream, "quality_of_service"):
-            await stream.quality_of_service(StreamClient.QOSLevel.EXPRESS)
-        elif hasattr(stream, "set_quality_of_service"):
-            await stream.set_quality_of_service(StreamClient.QOSLevel.EXPRESS)
-        elif hasattr(stream, "set_qos"):
-            await stream.set_qos(StreamClient.QOSLevel.EXPRESS)
+        if set_qos is not None:
+            await set_qos(StreamClient.QOSLevel.EXPRESS)
     except Exception as e:
         log_structured("QOS_ERROR", {"error": f"Failed to set QoS: {e}"})
 
+    trade_subs = stream.timesale_equity_subs if has_ts else stream.chart_equity_subs
     await stream.level_one_equity_subs(SYMBOLS)
-    if has_ts:
-        await stream.timesale_equity_subs(SYMBOLS)
-    else:
-        await stream.chart_equity_subs(SYMBOLS)
-
+    await trade_subs(SYMBOLS)
+
+    pending = [s for s in SYMBOLS if s not in _HARDCODED_EX]
+    exchanges = dict(zip(pending, await asyncio.gather(*(resolve_exchange(client, s) for s in pending))))
+    # Group symbols per book service and subscribe each group in one call.
+    # A *_book_subs call replaces that service's subscription set, so one
+    # request per symbol would also have left only the last symbol subscribed.
+    book_subs = {"NASDAQ": stream.nasdaq_book_subs, "NYSE": stream.nyse_book_subs}
+    by_exchange: Dict[str, List[str]] = {ex: [] for ex in book_subs}
     for sym in SYMBOLS:
-        if sym == "CRON":
-            log_structured("SUBS", {"symbol": sym, "exchange": "NASDAQ"})
-            await stream.nasdaq_book_subs([sym])
-            continue
-        if sym == "F":
-            log_structured("SUBS", {"symbol": sym, "exchange": "NYSE"})
-            await stream.nyse_book_subs([sym])
+        ex = _HARDCODED_EX.get(sym)
+        if ex is not None:
+            log_structured("SUBS", {"symbol": sym, "exchange": ex})
+        else:
+            ex = exchanges[sym]
+        if ex in by_exchange:
+            by_exchange[ex].append(sym)
             continue
-        ex = await resolve_exchange(client, sym)
-        if ex is None:
-            if sym not in PRINTED_NO_INSTR:
+        if sym not in PRINTED_NO_INSTR:
+            if ex is None:
                 log_structured("SUBS_WARNING", {"symbol": sym, "message": "No instrument found, subscribing to both books"})
-                PRINTED_NO_INSTR.add(sym)
-            await stream.nasdaq_book_subs([sym])
-            await stream.nyse_book_subs([sym])
-        elif ex == "NASDAQ":
-            await stream.nasdaq_book_subs([sym])
-        elif ex == "NYSE":
-            await stream.nyse_book_subs([sym])
-        else:
-            if sym not in PRINTED_NO_INSTR:
+            else:
                 log_structured("SUBS_WARNING", {"symbol": sym, "exchange": ex, "message": "Unsupported exchange, subscribing to both"})
-                PRINTED_NO_INSTR.add(sym)
-            await stream.nasdaq_book_subs([sym])
-            await stream.nyse_book_subs([sym])
+            PRINTED_NO_INSTR.add(sym)
+        for syms in by_exchange.values():
+            syms.append(sym)
+    for ex, syms in by_exchange.items():
+        if syms:
+            await book_subs[ex](syms)
 
     log_structured("SUBS", {"message": f"Subscribed to L1, {'timesales' if has_ts else 'chart'}, and L2 for: {', '.join(SYMBOLS)}"})
     log_structured("START", {
         "symbols": SYMBOLS,
-        "window": WINDOW_SECONDS,
-        "venues": MIN_ASK_HEAVY,
-        "spread_cents": MAX_RANGE_CENTS,
-        "volume_per_min": MIN_VOLUME,
-        "min_imbalance_duration": MIN_IMBALANCE_DURATION_SEC,
+        "window": CFG.window_seconds,
+        "venues": CFG.min_ask_heavy,
+        "spread_cents": CFG.max_range_cents,
+        "volume_per_min": CFG.min_volume,
+        "min_imbalance_duration": CFG.min_imbalance_duration_sec,
         "imbalance_threshold": 4
     })
 
     hb_task = asyncio.create_task(_heartbeat_task())
+    optimize_task = asyncio.create_task(_db_optimize_task())
+    coalesce_task = None
+    if CFG.book_coalesce_ms > 0:
+        _book_wake = asyncio.Event()
+        coalesce_task = asyncio.create_task(_book_coalesce_task(CFG))
     book_task = None
     if SHOW_BOOK:
         book_task = asyncio.create_task(_book_monitor_task())
 
+    # The receive loop runs as its own task and just stamps the loop clock per
+    # message; the loop below checks that stamp every STREAM_WATCHDOG_SEC
+    # rather than arming a 30 s wait_for timer for each message. Stream
+    # methods and DEBUG are bound to locals once.
+    loop = asyncio.get_running_loop()
+    loop_time = loop.time
+    last_msg = loop_time()
+
+    async def receive_messages():
+        nonlocal last_msg
+        handle_message = stream.handle_message
+        debug = DEBUG
+        while True:
+            msg = await handle_message()
+            last_msg = loop_time()
+            if debug:
+                log_structured("STREAM_DEBUG", {"message": msg})
+
+    recv_task = None
     try:
         while True:
+            last_msg = loop_time()
+            recv_task = asyncio.create_task(receive_messages())
+            while not recv_task.done() and loop_time() - last_msg <= STREAM_IDLE_TIMEOUT_SEC:
+                await asyncio.wait((recv_task,), timeout=STREAM_WATCHDOG_SEC)
+            if recv_task.done():
+                recv_task.result()  # re-raise whatever stopped the receive loop
+            recv_task.cancel()
             try:
-                msg = await asyncio.wait_for(stream.handle_message(), timeout=30.0)
-                if DEBUG:
-                    log_structured("STREAM_DEBUG", {"message": msg})
-            except asyncio.TimeoutError:
-                log_structured("STREAM_ERROR", {"error": "No messages for 30s"})
-                if not await connect_with_retries():
-                    log_structured("STREAM_ERROR", {"error": "Reconnection failed"})
-                    break
+                await recv_task
+            except asyncio.CancelledError:
+                pass
+            log_structured("STREAM_ERROR", {"error": f"No messages for {STREAM_IDLE_TIMEOUT_SEC:g}s"})
+            if not await connect_with_retries():
+                log_structured("STREAM_ERROR", {"error": "Reconnection failed"})
+                break
     except KeyboardInterrupt:
         log_structured("STOP", {"message": "User stopped"})
     finally:
+        if recv_task:
+            recv_task.cancel()
         hb_task.cancel()
+        optimize_task.cancel()
         if book_task:
             book_task.cancel()
+        if coalesce_task:
+            coalesce_task.cancel()
+        writer_task.cancel()
+        try:
+            await writer_task
+        except asyncio.CancelledError:
+            pass
+        # In-flight trades finish (they borrow pool readers) and the trader
+        # flushes its order records and state before the pool is closed.
+        if _trader_executor:
+            await asyncio.to_thread(_trader_executor.shutdown, wait=True)
+        if inline_trader is not None:
+            inline_trader.close()
         if conn:
-            conn.close()
+            _drain_alert_queue()
+            _optimize_db()
+            pool.close()
         try:
             await stream.logout()
         except Exception:
             pass
 
 if __name__ == "__main__":
+    log_listener = _start_log_listener()
     try:
-        asyncio.run(main())
+        try:  # optional: libuv-backed event loop, noticeably lower per-message overhead
+            import uvloop
+        except ImportError:
+            asyncio.run(main(), debug=False)
+        else:
+            uvloop.run(main(), debug=False)
     except KeyboardInterrupt:
         log_structured("STOP", {"message": "User stopped"})
     except Exception as e:
         log_structured("FATAL_ERROR", {"error": str(e)})
         sys.exit(5)
+    finally:
+        log_listener.stop()  # flushes whatever is still queued
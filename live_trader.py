@@ -15,17 +15,31 @@ from __future__ import annotations
 
 import argparse
 import atexit
+import inspect
 import json
 import logging
 import os
+import random
 import sqlite3
 import sys
 import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import chain
 from pathlib import Path
-from typing import Dict, Optional
+from queue import Empty, SimpleQueue
+from typing import Callable, ContextManager, Dict, Optional
 from urllib.parse import urlparse
 
+try:  # optional: faster JSON encoding for live_orders.raw_response
+    import orjson
+except ImportError:
+    orjson = None
+try:  # optional (Linux): inotify watch for the kill-switch file
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
 from dotenv import load_dotenv
 from schwab.auth import easy_client
 from schwab.orders import equities as equity_orders
@@ -66,6 +80,95 @@ def _bool_env(name: str, default: bool = False) -> bool:
     return raw.strip().lower() in {"1", "true", "yes", "on"}
 
 
+# Settings for LiveTrader's long-lived live_orders writer connection. grok.py
+# puts the DB in WAL mode as well; NORMAL sync only fsyncs at checkpoints.
+_WRITER_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+# ...and for the standalone trader's long-lived alerts reader.
+_READ_PRAGMAS = (
+    "PRAGMA query_only=1",
+    "PRAGMA cache_size=-16384",  # 16 MB page cache
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+# A batch of queued live_orders rows goes out as one multi-row INSERT. Chunks
+# stay under SQLite's historical 999 bound-parameter limit (90 rows x 11
+# columns), and the SQL text per chunk length is built once so sqlite3's
+# statement cache keeps reusing the compiled statement.
+_LIVE_ORDER_COLUMNS = (
+    "alert_rowid, symbol, direction, side, qty, price, order_id, status_code, location, error, raw_response"
+)
+_LIVE_ORDER_PARAMS = 11
+_LIVE_ORDER_CHUNK_ROWS = 999 // _LIVE_ORDER_PARAMS
+_INSERT_LIVE_ORDER_SQL: Dict[int, str] = {}
+
+
+def _insert_live_orders_sql(n_rows: int) -> str:
+    sql = _INSERT_LIVE_ORDER_SQL.get(n_rows)
+    if sql is None:
+        row = "(" + ", ".join("?" * _LIVE_ORDER_PARAMS) + ")"
+        sql = _INSERT_LIVE_ORDER_SQL[n_rows] = (
+            f"INSERT INTO live_orders ({_LIVE_ORDER_COLUMNS}) VALUES " + ", ".join([row] * n_rows)
+        )
+    return sql
+
+
+# Result keys that already have their own live_orders column; raw_response
+# only carries the rest (fill status, dry-run flag, ...).
+_ORDER_COLUMN_KEYS = frozenset({"symbol", "side", "qty", "order_id", "status_code", "location", "error"})
+
+
+def _serialize_order_extras(result: dict) -> str:
+    extras = {k: v for k, v in result.items() if k not in _ORDER_COLUMN_KEYS}
+    if orjson is not None:
+        return orjson.dumps(extras, default=str).decode()
+    return json.dumps(extras, default=str)
+
+
+# Flip-only alert handling: (direction, sign of current position) -> (order
+# side, LiveTrader size attribute), or None when the alert would stack onto
+# a position already on that side. A flip is one order for flip_size.
+_ALERT_ACTIONS: Dict[tuple[str, int], Optional[tuple[str, str]]] = {
+    ("ask-heavy", 0): ("SHORT", "initial_entry_size"),
+    ("ask-heavy", 1): ("SHORT", "flip_size"),
+    ("ask-heavy", -1): None,
+    ("bid-heavy", 0): ("BUY", "initial_entry_size"),
+    ("bid-heavy", -1): ("BUY", "flip_size"),
+    ("bid-heavy", 1): None,
+}
+
+
+# Read queries are kept as constants and run through Connection.execute so
+# the same SQL text hits each connection's statement cache on every call.
+_LAST_ALERT_ID_SQL = "SELECT MAX(rowid) FROM alerts"
+_LAST_PRICES_SQL = (
+    "SELECT symbol, price FROM alerts WHERE rowid IN (SELECT MAX(rowid) FROM alerts GROUP BY symbol)"
+)
+# Each poll reads at most _NEW_ALERTS_LIMIT rows (a range scan on the rowid
+# b-tree, so no extra index helps); run() re-polls at once after a full batch.
+_NEW_ALERTS_LIMIT = 1000
+_NEW_ALERTS_SQL = (
+    "SELECT rowid, symbol, direction, price FROM alerts WHERE rowid > ? "
+    f"ORDER BY rowid ASC LIMIT {_NEW_ALERTS_LIMIT}"
+)
+
+# Poll cadence for run(), in integer nanoseconds so deadlines are computed and
+# compared on time.monotonic_ns() without float arithmetic.
+_POLL_MIN_SLEEP_NS = 50_000_000         # hot path while alerts are flowing
+_POLL_VERSION_PROBE_NS = 10_000_000     # data_version probe while idle
+_POLL_MAX_SLEEP_NS = 2_000_000_000      # idle backoff floor for the ceiling
+# inotify watcher threads wait on their fd in slices of this many ms, so they
+# notice a stop request and close the fd themselves instead of being left
+# blocked in read() on a descriptor another thread closed.
+_WATCH_READ_TIMEOUT_MS = 250
+
+
 class SchwabOrderExecutor:
     """Thin wrapper around ``schwab-py`` order placement.
 
@@ -81,6 +184,22 @@ class SchwabOrderExecutor:
         app_secret = _require_env("SCHWAB_APP_SECRET")
         redirect_uri = _normalize_and_validate_callback(_require_env("SCHWAB_REDIRECT_URI"))
         token_path = Path(os.getenv("SCHWAB_TOKEN_PATH", "./schwab_tokens.json"))
+        # Quotes are reused for LIVE_QUOTE_TTL_MS so a burst of alerts on the
+        # same ticker shares one HTTPS round trip.
+        self.quote_ttl = max(float(os.getenv("LIVE_QUOTE_TTL_MS", "250")), 0.0) / 1000.0
+        self._quote_cache: Dict[str, tuple[float, dict]] = {}
+        # Order builders are resolved once, along with whether this schwab-py
+        # version takes (symbol, quantity) positionally.
+        self._builders = {
+            "BUY": equity_orders.equity_buy_market,
+            "SELL": equity_orders.equity_sell_market,
+            "SHORT": equity_orders.equity_sell_short_market,
+            "COVER": equity_orders.equity_buy_to_cover_market,
+        }
+        params = list(inspect.signature(equity_orders.equity_buy_market).parameters.values())[:2]
+        self._builders_positional = len(params) == 2 and all(
+            p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in params
+        )
 
         LOGGER.info("Initializing Schwab client (dry_run=%s)", self.dry_run)
         try:
@@ -156,6 +275,11 @@ class SchwabOrderExecutor:
         if self.dry_run:
             return None
 
+        now = time.monotonic()
+        cached = self._quote_cache.get(symbol)
+        if cached is not None and now - cached[0] < self.quote_ttl:
+            return cached[1]
+
         fetch_quote = getattr(self.client, "get_quote", None)
         if fetch_quote is None:
             LOGGER.warning("Schwab client does not expose get_quote; skipping refresh")
@@ -173,9 +297,37 @@ class SchwabOrderExecutor:
             payload = None
 
         if isinstance(payload, dict):
-            return payload.get(symbol) or payload
+            quote = payload.get(symbol) or payload
+            self._quote_cache[symbol] = (now, quote)
+            return quote
         return None
 
+    def fetch_quotes(self, symbols: list[str]) -> Dict[str, dict]:
+        """Fetch quotes for several symbols in one request (symbol -> quote)."""
+
+        if self.dry_run or not symbols:
+            return {}
+
+        fetch_quotes = getattr(self.client, "get_quotes", None)
+        if fetch_quotes is None:
+            LOGGER.warning("Schwab client does not expose get_quotes; skipping bulk refresh")
+            return {}
+
+        try:
+            response = fetch_quotes(symbols)
+            payload = response.json() if hasattr(response, "json") else None
+        except Exception as exc:  # pragma: no cover - network interaction
+            LOGGER.warning("Bulk quote fetch failed for %s: %s", symbols, exc)
+            return {}
+
+        if not isinstance(payload, dict):
+            return {}
+        now = time.monotonic()
+        quotes = {sym: q for sym, q in payload.items() if sym in symbols and isinstance(q, dict)}
+        for sym, quote in quotes.items():
+            self._quote_cache[sym] = (now, quote)
+        return quotes
+
     def fetch_order_status(self, order_id: str) -> Dict[str, Optional[str]]:
         result: Dict[str, Optional[str]] = {"order_id": order_id, "status": None, "error": None}
 
@@ -214,22 +366,17 @@ class SchwabOrderExecutor:
         return result
 
     def submit_market(self, *, symbol: str, qty: int, side: str) -> Dict[str, Optional[str]]:
-        builders = {
-            "BUY": equity_orders.equity_buy_market,
-            "SELL": equity_orders.equity_sell_market,
-            "SHORT": equity_orders.equity_sell_short_market,
-            "COVER": equity_orders.equity_buy_to_cover_market,
-        }
+        side = side.upper()
         try:
-            builder_factory = builders[side.upper()]
+            builder_factory = self._builders[side]
         except KeyError as exc:
             raise ValueError(f"Unsupported side '{side}'") from exc
 
-        try:
+        if self._builders_positional:
             builder = builder_factory(symbol, qty)
-        except TypeError:
+        else:
             builder = builder_factory(symbol=symbol, quantity=qty)
-        return self._send(builder, symbol=symbol, side=side.upper(), qty=qty)
+        return self._send(builder, symbol=symbol, side=side, qty=qty)
 
     def cancel_all_orders(self) -> bool:
         """Attempt to cancel all open orders on the account."""
@@ -261,7 +408,13 @@ class LiveTrader:
     and a kill-switch file.
     """
 
-    def __init__(self, *, dry_run: bool = False, executor: Optional[SchwabOrderExecutor] = None) -> None:
+    def __init__(
+        self,
+        *,
+        dry_run: bool = False,
+        executor: Optional[SchwabOrderExecutor] = None,
+        reader: Optional[Callable[[], ContextManager[sqlite3.Connection]]] = None,
+    ) -> None:
         self.db_path = Path(os.getenv("DB_PATH", "penny_basing.db"))
         self.position_size = int(os.getenv("LIVE_POSITION_SIZE", os.getenv("POSITION_SIZE", "5000")))
         self.initial_entry_size = int(os.getenv("LIVE_INITIAL_SIZE", str(self.position_size)))
@@ -271,14 +424,69 @@ class LiveTrader:
         self.executor = executor if executor is not None else SchwabOrderExecutor(dry_run=dry_run)
         self.dry_run = getattr(self.executor, "dry_run", dry_run)
         self.kill_switch_path = Path(os.getenv("LIVE_KILL_SWITCH_FILE", "kill_switch.flag"))
+        self._kill_flag = threading.Event()
+        # Set by the inotify watchers (new alerts, kill switch) to wake run().
+        self._wake = threading.Event()
+        self._kill_watch_stop = threading.Event()
+        self._kill_watch = self._start_kill_switch_watch()
         self.max_trades_per_hour = int(os.getenv("LIVE_MAX_TRADES_PER_HOUR", "60"))
         self.positions: Dict[str, int] = {}
         self.last_alert_id = 0
-        self.trade_timestamps: list[float] = []
+        # Monotonic fill times, oldest first; pruned from the left.
+        self.trade_timestamps: deque[float] = deque()
+        # Last alert price seen per symbol, so the kill-switch flatten is a
+        # dict lookup. After a restart it is seeded once from the alerts table.
+        self._last_price: Dict[str, float] = {}
+        self._last_price_warmed = False
         self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._last_state_payload: Optional[bytes] = None
+        # Independent orders (e.g. the per-symbol flatten on emergency stop)
+        # go out in parallel on this pool; _fill_lock serializes the position
+        # and trade-rate bookkeeping their fills update.
+        self._order_pool = ThreadPoolExecutor(
+            max_workers=max(int(os.getenv("LIVE_ORDER_WORKERS", "4")), 1), thread_name_prefix="live-order"
+        )
+        self._fill_lock = threading.Lock()
+        self._shutting_down = False
+        self.flatten_timeout = float(os.getenv("LIVE_FLATTEN_TIMEOUT", "2"))
+        # grok passes SqlitePool.borrow_reader so inline lookups reuse its
+        # read-only connections; standalone runs share one long-lived reader
+        # so its page and statement caches stay warm instead of reopening the
+        # DB per lookup. run() polls on a connection of its own.
+        self._reader = reader
+        self._read_db: Optional[sqlite3.Connection] = None
+        # Inline (grok-hosted) traders coalesce state-file writes: a fill
+        # schedules one save LIVE_STATE_SAVE_DELAY_MS later on a timer thread
+        # instead of writing the file on the alert's thread.
+        self._inline = reader is not None
+        self.state_save_delay = max(float(os.getenv("LIVE_STATE_SAVE_DELAY_MS", "200")), 0.0) / 1000.0
+        self._state_timer: Optional[threading.Timer] = None
+        # run() polls with busy_timeout=0 and retries "database is locked"
+        # itself: full-jitter sleeps over a window starting at LIVE_BUSY_BASE_MS
+        # and doubling up to LIVE_BUSY_CAP_MS, for LIVE_BUSY_RETRIES attempts,
+        # so brief checkpoint contention clears in about a millisecond.
+        self.busy_base = max(float(os.getenv("LIVE_BUSY_BASE_MS", "1")), 0.0) / 1000.0
+        self.busy_cap = max(float(os.getenv("LIVE_BUSY_CAP_MS", "50")), 0.0) / 1000.0
+        self.busy_retries = max(int(os.getenv("LIVE_BUSY_RETRIES", "10")), 0)
+        # live_orders rows are queued for a writer thread that commits them in
+        # batches (up to LIVE_ORDER_BATCH_MAX rows or LIVE_ORDER_BATCH_WINDOW_MS)
+        # on one long-lived connection, so placing an order never waits on a
+        # commit.
+        self.order_batch_max = max(int(os.getenv("LIVE_ORDER_BATCH_MAX", "32")), 1)
+        self.order_batch_window = max(float(os.getenv("LIVE_ORDER_BATCH_WINDOW_MS", "20")), 0.0) / 1000.0
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        for pragma in _WRITER_PRAGMAS:
+            self._db.execute(pragma)
+        if reader is None:
+            self._read_db = self._open_read_conn()
+        self._write_q: SimpleQueue = SimpleQueue()
 
         self._load_state()
         self._init_db_schema()
+        self._writer = threading.Thread(target=self._order_writer_loop, name="live-orders-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
         if not self.dry_run:
             atexit.register(self._save_state)
 
@@ -289,7 +497,9 @@ class LiveTrader:
         if not self.state_path.exists():
             return
         try:
-            data = json.loads(self.state_path.read_text())
+            raw = self.state_path.read_bytes()
+            data = json.loads(raw)
+            self._last_state_payload = raw
             self.positions = {k: int(v) for k, v in data.get("positions", {}).items()}
             self.last_alert_id = int(data.get("last_alert_id", 0))
             LOGGER.info("Loaded state: %s positions", len(self.positions))
@@ -297,26 +507,80 @@ class LiveTrader:
             LOGGER.warning("Failed to load state: %s", exc)
 
     def _save_state(self) -> None:
+        # The state file is only rewritten when its contents change, and the
+        # write goes to a temp file that os.replace swaps in, so a crash
+        # mid-write never leaves a truncated state file behind.
         if self.dry_run:
             return
-        payload = {"positions": self.positions, "last_alert_id": self.last_alert_id}
-        try:
-            self.state_path.write_text(json.dumps(payload, indent=2))
-        except Exception as exc:
-            LOGGER.error("Failed to persist state: %s", exc)
+        state = {"positions": dict(self.positions), "last_alert_id": self.last_alert_id}
+        if orjson is not None:
+            payload = orjson.dumps(state, option=orjson.OPT_INDENT_2)
+        else:
+            payload = json.dumps(state, indent=2).encode()
+        with self._state_lock:
+            if payload == self._last_state_payload:
+                return
+            tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+            try:
+                tmp_path.write_bytes(payload)
+                os.replace(tmp_path, self.state_path)
+            except Exception as exc:
+                LOGGER.error("Failed to persist state: %s", exc)
+                return
+            self._last_state_payload = payload
+
+    def _flush_scheduled_state(self) -> None:
+        with self._state_lock:
+            self._state_timer = None
+        self._save_state()
+
+    def _persist_state(self) -> None:
+        if self.dry_run:
+            return
+        if not self._inline:
+            self._save_state()
+            return
+        with self._state_lock:
+            if self._state_timer is not None:
+                return
+            self._state_timer = threading.Timer(self.state_save_delay, self._flush_scheduled_state)
+            self._state_timer.daemon = True
+            self._state_timer.start()
 
     # ------------------------------------------------------------------
     # DB helpers
     # ------------------------------------------------------------------
-    def _open_conn(self) -> sqlite3.Connection:
-        # Simple, thread-safe-ish SQLite connection helper so every DB touch
-        # uses the same pragmatic settings.
+    def _open_read_conn(self) -> sqlite3.Connection:
+        # The standalone reader only ever SELECTs; query_only guards that, and
+        # in WAL mode it reads alongside grok's and our own writers.
+        # Rows stay plain tuples (no sqlite3.Row); every caller unpacks them
+        # positionally.
         conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
+        for pragma in _READ_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _open_poll_conn(self) -> sqlite3.Connection:
+        # run()'s own reader. Lock contention on the alerts poll is retried in
+        # _fetch_new_alerts, so SQLite's busy handler is turned off here only;
+        # the shared _read_db keeps busy_timeout for every other lookup.
+        conn = self._open_read_conn()
+        conn.execute("PRAGMA busy_timeout=0")
         return conn
 
+    def _fetch_new_alerts(self, conn: sqlite3.Connection) -> list:
+        attempt = 0
+        while True:
+            try:
+                return conn.execute(_NEW_ALERTS_SQL, (self.last_alert_id,)).fetchall()
+            except sqlite3.OperationalError as exc:
+                if "locked" not in str(exc) or attempt >= self.busy_retries:
+                    raise
+            time.sleep(random.uniform(0.0, min(self.busy_cap, self.busy_base * (2 ** attempt))))
+            attempt += 1
+
     def _init_db_schema(self) -> None:
-        with self._open_conn() as conn:
+        with self._db as conn:
             cur = conn.cursor()
             cur.execute(
                 """
@@ -332,6 +596,9 @@ class LiveTrader:
                 )
                 """
             )
+            # Same index grok.py's schema migration creates; the last-price
+            # warm-up query groups by symbol.
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_alerts_symbol ON alerts(symbol)")
             cur.execute(
                 """
                 CREATE TABLE IF NOT EXISTS live_orders (
@@ -351,31 +618,41 @@ class LiveTrader:
                 )
                 """
             )
-            conn.commit()
 
         if self.last_alert_id == 0:
             self.last_alert_id = self._get_last_alert_id_from_db()
 
+    def _read_conn(self) -> ContextManager[sqlite3.Connection]:
+        # A Connection is its own context manager (commit/rollback, no close).
+        return self._reader() if self._reader is not None else self._read_db
+
     def _get_last_alert_id_from_db(self) -> int:
         try:
-            with self._open_conn() as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT MAX(rowid) FROM alerts")
-                row = cur.fetchone()
+            with self._read_conn() as conn:
+                row = conn.execute(_LAST_ALERT_ID_SQL).fetchone()
                 return int(row[0]) if row and row[0] else 0
         except sqlite3.Error:
             LOGGER.warning("alerts table missing; starting with last_alert_id=0")
             return 0
 
+    def _warm_last_prices(self) -> None:
+        self._last_price_warmed = True
+        try:
+            with self._read_conn() as conn:
+                rows = conn.execute(_LAST_PRICES_SQL).fetchall()
+        except sqlite3.Error as exc:
+            LOGGER.warning("Could not load last alert prices: %s", exc)
+            return
+        for symbol, price in rows:
+            if price is not None:
+                self._last_price.setdefault(symbol, float(price))
+
     def _latest_price(self, symbol: str) -> Optional[float]:
-        with self._open_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "SELECT price FROM alerts WHERE symbol=? ORDER BY rowid DESC LIMIT 1",
-                (symbol,),
-            )
-            row = cur.fetchone()
-            return float(row[0]) if row else None
+        price = self._last_price.get(symbol)
+        if price is None and not self._last_price_warmed:
+            self._warm_last_prices()
+            price = self._last_price.get(symbol)
+        return price
 
     # ------------------------------------------------------------------
     # Position bookkeeping
@@ -390,11 +667,12 @@ class LiveTrader:
 
     def _record_fill(self, *, symbol: str, side: str, qty: int) -> None:
         delta = qty if side in {"BUY", "COVER"} else -qty
-        self._apply_position_delta(symbol, delta)
-        if not self.dry_run:
-            self._save_state()
-        self.trade_timestamps.append(time.time())
-        self._enforce_trade_rate_limit()
+        with self._fill_lock:
+            self._apply_position_delta(symbol, delta)
+            self._persist_state()
+            self.trade_timestamps.append(time.monotonic())
+        if not self._shutting_down:
+            self._enforce_trade_rate_limit()
 
     def _apply_filled_delta(
         self, *, symbol: str, side: str, qty: int, filled_qty: int, filled_qty_seen: int
@@ -425,41 +703,117 @@ class LiveTrader:
         return filled_qty
 
     def _enforce_trade_rate_limit(self) -> None:
-        cutoff = time.time() - 3600
-        self.trade_timestamps = [ts for ts in self.trade_timestamps if ts >= cutoff]
-        if len(self.trade_timestamps) > self.max_trades_per_hour:
+        cutoff = time.monotonic() - 3600
+        timestamps = self.trade_timestamps
+        with self._fill_lock:
+            while timestamps and timestamps[0] < cutoff:
+                timestamps.popleft()
+            recent = len(timestamps)
+        if recent > self.max_trades_per_hour:
             LOGGER.error(
                 "Trade rate exceeded limit (%s in the last hour); engaging kill switch",
-                len(self.trade_timestamps),
+                recent,
             )
             self._engage_emergency_shutdown("Trade-per-hour limit exceeded")
 
     def _engage_emergency_shutdown(self, reason: str) -> None:
         LOGGER.error("EMERGENCY STOP: %s", reason)
+        self._shutting_down = True
         try:
             self.executor.cancel_all_orders()
         except Exception as exc:  # pragma: no cover - defensive
             LOGGER.warning("Failed to request cancel-all: %s", exc)
 
-        for symbol, qty in list(self.positions.items()):
-            if qty == 0:
-                continue
-            side = "SELL" if qty > 0 else "COVER"
-            price = self._latest_price(symbol) or 0.0
-            self._submit_order(
+        open_positions = [(symbol, qty) for symbol, qty in self.positions.items() if qty != 0]
+        # One quote request for every open symbol refreshes the flatten prices.
+        fetch_quotes = getattr(self.executor, "fetch_quotes", None)
+        if fetch_quotes is not None and open_positions:
+            for symbol, quote in fetch_quotes([symbol for symbol, _ in open_positions]).items():
+                last = (quote.get("quote") or quote).get("lastPrice")
+                if last:
+                    self._last_price[symbol] = float(last)
+
+        # Prices are resolved here, before the pool starts, so the one-off
+        # _warm_last_prices runs on this thread and not in several legs at once.
+        legs = [(symbol, qty, self._latest_price(symbol) or 0.0) for symbol, qty in open_positions]
+
+        def flatten(item: tuple[str, int, float]) -> bool:
+            symbol, qty, price = item
+            return self._submit_order(
                 alert_id=-1,
                 symbol=symbol,
                 direction="kill-switch",
-                side=side,
+                side="SELL" if qty > 0 else "COVER",
                 qty=abs(qty),
                 price=price,
             )
 
+        futures = {self._order_pool.submit(flatten, item): item[0] for item in legs}
+        # A stuck order leg must not hold up the stop; give them all
+        # LIVE_FLATTEN_TIMEOUT seconds and log whatever is still pending.
+        done, pending = wait(futures, timeout=self.flatten_timeout)
+        for future in done:
+            try:
+                future.result()
+            except Exception as exc:  # pragma: no cover - defensive
+                LOGGER.error("Flatten order failed for %s: %s", futures[future], exc)
+        for future in pending:
+            LOGGER.error("Flatten order for %s still pending after %.1fs", futures[future], self.flatten_timeout)
+
         self._save_state()
         raise SystemExit(1)
 
-    def _check_kill_switch(self) -> None:
+    def _start_kill_switch_watch(self) -> bool:
+        # With inotify_simple installed, a daemon thread watches the kill-switch
+        # directory: creating (or moving in) the file sets _kill_flag, deleting
+        # (or moving) it away clears it again, so _check_kill_switch is a flag
+        # test instead of a stat() per pass. The thread runs until close().
+        if INotify is None:
+            return False
+        try:
+            inotify = INotify()
+            inotify.add_watch(
+                str(self.kill_switch_path.parent),
+                inotify_flags.CREATE | inotify_flags.MOVED_TO | inotify_flags.DELETE | inotify_flags.MOVED_FROM,
+            )
+        except OSError as exc:
+            LOGGER.warning("Kill switch watch unavailable, falling back to stat: %s", exc)
+            return False
+        name = self.kill_switch_path.name
+        removed = inotify_flags.DELETE | inotify_flags.MOVED_FROM
+        stop = self._kill_watch_stop
+
+        def watch() -> None:
+            try:
+                while not stop.is_set():
+                    for event in inotify.read(timeout=_WATCH_READ_TIMEOUT_MS):
+                        if event.name != name:
+                            continue
+                        if event.mask & removed:
+                            self._kill_flag.clear()
+                        else:
+                            self._kill_flag.set()
+                            self._wake.set()
+            except OSError as exc:
+                LOGGER.warning("Kill switch watch failed, falling back to stat: %s", exc)
+                self._kill_watch = False
+            finally:
+                inotify.close()
+
+        threading.Thread(target=watch, name="kill-switch-watch", daemon=True).start()
+        # The file may have been created before the watch was registered.
         if self.kill_switch_path.exists():
+            self._kill_flag.set()
+        return True
+
+    def _check_kill_switch(self) -> None:
+        if self._kill_watch:
+            # A set flag is confirmed with one stat, so a file that was
+            # created and removed again between events never halts trading.
+            tripped = self._kill_flag.is_set() and self.kill_switch_path.exists()
+        else:
+            tripped = self.kill_switch_path.exists()
+        if tripped:
             LOGGER.error("Kill switch file %s detected", self.kill_switch_path)
             self._engage_emergency_shutdown("Kill switch activated")
 
@@ -467,30 +821,108 @@ class LiveTrader:
     # Order + alert processing
     # ------------------------------------------------------------------
     def _record_order(self, *, alert_id: int, symbol: str, direction: str, side: str, qty: int, price: float, result: dict) -> None:
-        serialized = json.dumps(result, default=str)
-        with self._open_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                """
-                INSERT INTO live_orders
-                (alert_rowid, symbol, direction, side, qty, price, order_id, status_code, location, error, raw_response)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    alert_id,
-                    symbol,
-                    direction,
-                    side,
-                    qty,
-                    price,
-                    result.get("order_id"),
-                    result.get("status_code"),
-                    result.get("location"),
-                    result.get("error"),
-                    serialized,
-                ),
+        serialized = _serialize_order_extras(result)
+        self._write_q.put(
+            (
+                alert_id,
+                symbol,
+                direction,
+                side,
+                qty,
+                price,
+                result.get("order_id"),
+                result.get("status_code"),
+                result.get("location"),
+                result.get("error"),
+                serialized,
             )
-            conn.commit()
+        )
+
+    def _write_order_rows(self, rows: list[tuple]) -> None:
+        # _db runs in autocommit mode, so the batch's transaction is explicit.
+        db = self._db
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            for start in range(0, len(rows), _LIVE_ORDER_CHUNK_ROWS):
+                chunk = rows[start:start + _LIVE_ORDER_CHUNK_ROWS]
+                db.execute(_insert_live_orders_sql(len(chunk)), tuple(chain.from_iterable(chunk)))
+            db.execute("COMMIT")
+        except sqlite3.Error as exc:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            LOGGER.error("Failed to record %s order(s): %s", len(rows), exc)
+
+    def _order_writer_loop(self) -> None:
+        # A None on the queue (from close) flushes what was collected and
+        # exits; an Event (from flush) is set once everything queued ahead of
+        # it has been written.
+        write_q = self._write_q
+        while True:
+            row = write_q.get()
+            if row is None:
+                return
+            if isinstance(row, threading.Event):
+                row.set()
+                continue
+            rows = [row]
+            deadline = time.monotonic() + self.order_batch_window
+            stop = False
+            flushed: Optional[threading.Event] = None
+            while len(rows) < self.order_batch_max:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = write_q.get(timeout=remaining)
+                except Empty:
+                    break
+                if row is None:
+                    stop = True
+                    break
+                if isinstance(row, threading.Event):
+                    flushed = row
+                    break
+                rows.append(row)
+            self._write_order_rows(rows)
+            if flushed is not None:
+                flushed.set()
+            if stop:
+                return
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every order record queued so far has been written.
+
+        live_orders rows are committed by a background thread, so callers that
+        read back what they just placed call this first. Returns False if the
+        writer did not catch up within ``timeout`` seconds.
+        """
+
+        if not self._writer.is_alive():
+            return True
+        done = threading.Event()
+        self._write_q.put(done)
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """Flush queued order records and pending state, then close the DB handles."""
+
+        self._kill_watch_stop.set()
+        # Order legs still on the pool record fills and queue order rows, so
+        # they finish before the state save and the writer's final flush.
+        self._order_pool.shutdown(wait=True)
+        # A coalesced save still waiting on its timer would be lost with the
+        # daemon thread, so cancel it and write the state now.
+        with self._state_lock:
+            timer, self._state_timer = self._state_timer, None
+        if timer is not None:
+            timer.cancel()
+        self._save_state()
+        if self._writer.is_alive():
+            self._write_q.put(None)
+            self._writer.join()
+        self._db.close()
+        if self._read_db is not None:
+            self._read_db.close()
 
     def _submit_order(
         self,
@@ -544,35 +976,22 @@ class LiveTrader:
 
     def _handle_alert(self, alert_id: int, symbol: str, direction: str, price: float) -> None:
         position = self.positions.get(symbol, 0)
+        sign = (position > 0) - (position < 0)
+        action = _ALERT_ACTIONS.get((direction, sign), ())
+        if not action:
+            if action is None:
+                LOGGER.info("Already %s %s; skip stacking", "short" if sign < 0 else "long", symbol)
+            return
 
-        if direction == "ask-heavy":
-            if position < 0:
-                LOGGER.info("Already short %s; skip stacking", symbol)
-                return
-
-            qty = self.flip_size if position > 0 else self.initial_entry_size
-            self._submit_order(
-                alert_id=alert_id,
-                symbol=symbol,
-                direction=direction,
-                side="SHORT",
-                qty=qty,
-                price=price,
-            )
-        elif direction == "bid-heavy":
-            if position > 0:
-                LOGGER.info("Already long %s; skip stacking", symbol)
-                return
-
-            qty = self.flip_size if position < 0 else self.initial_entry_size
-            self._submit_order(
-                alert_id=alert_id,
-                symbol=symbol,
-                direction=direction,
-                side="BUY",
-                qty=qty,
-                price=price,
-            )
+        side, size_attr = action
+        self._submit_order(
+            alert_id=alert_id,
+            symbol=symbol,
+            direction=direction,
+            side=side,
+            qty=getattr(self, size_attr),
+            price=price,
+        )
 
     def process_alert(
         self,
@@ -591,83 +1010,174 @@ class LiveTrader:
         """
         with self._lock:
             self.last_alert_id = max(self.last_alert_id, int(alert_id))
+            self._last_price[symbol] = price
             self._handle_alert(alert_id, symbol, direction, price)
-            if persist_state and not self.dry_run:
-                self._save_state()
+            if persist_state:
+                self._persist_state()
+
+    def process_alerts_batch(self, rows) -> None:
+        """Process a burst of ``(rowid, symbol, direction, price)`` alerts.
+
+        Alerts are handled in rowid order under one lock acquisition. An
+        alert whose direction the current position already matches is
+        skipped, the same check _handle_alert makes, so a repeat after a
+        failed order still trades. Every change of direction is acted on,
+        since with LIVE_FLIP_SIZE != 2 * LIVE_INITIAL_SIZE dropping
+        intermediate flips would leave a different position. State is
+        persisted once.
+        """
+        if not rows:
+            return
+        positions = self.positions
+        max_id = self.last_alert_id
+        skipped = 0
+        # rowid is always an int and price has REAL affinity, so the values
+        # are used as sqlite3 returns them.
+        with self._lock:
+            for alert_id, symbol, direction, price in rows:
+                if alert_id > max_id:
+                    max_id = alert_id
+                self._last_price[symbol] = price
+                position = positions.get(symbol, 0)
+                if _ALERT_ACTIONS.get((direction, (position > 0) - (position < 0)), ()) is None:
+                    skipped += 1
+                    continue
+                self._handle_alert(alert_id, symbol, direction, price)
+            self.last_alert_id = max_id
+            self._persist_state()
+        if skipped:
+            LOGGER.info("Skipped %s alerts matching the open position in a burst of %s", skipped, len(rows))
 
     def run(self) -> None:
         # Keep the hot path responsive: when alerts are flowing we poll on a
-        # ~50ms cadence. During lulls we exponentially back off to avoid hot
-        # loops, but we watch for DB file writes every 10ms so a new alert can
-        # break the longer sleep immediately. This mirrors the low-latency
-        # monitoring used in ``paper_trader``.
-        min_sleep = 0.05
-        mtime_probe = 0.01
-        max_sleep = max(self.poll_interval, 2.0)
-        idle_sleep = min_sleep
-        db_path = self.db_path
-        last_db_mtime = db_path.stat().st_mtime if db_path.exists() else 0.0
+        # ~50ms cadence. When idle, the loop blocks on self._wake, which a
+        # watcher thread sets as soon as inotify reports a write to the DB or
+        # its -wal file (WAL commits land there). The kill-switch watcher sets
+        # it too, so a kill switch is acted on without waiting out the sleep.
+        #
+        # Without inotify the loop falls back to exponential backoff, and
+        # every 10ms it reads PRAGMA data_version, which changes whenever
+        # another connection commits, so a new alert still breaks the longer
+        # sleep. data_version is tracked per connection, so the loop sticks to
+        # one long-lived connection of its own.
+        max_sleep_ns = max(int(self.poll_interval * 1_000_000_000), _POLL_MAX_SLEEP_NS)
+        # time.sleep and Event.wait take seconds; convert once up front.
+        min_sleep = _POLL_MIN_SLEEP_NS / 1_000_000_000
+        version_probe = _POLL_VERSION_PROBE_NS / 1_000_000_000
+        max_sleep = max_sleep_ns / 1_000_000_000
+        idle_sleep_ns = _POLL_MIN_SLEEP_NS
+        conn = self._open_poll_conn()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        db_watch_stop = threading.Event()
+        db_watch = self._start_db_watch(db_watch_stop)
+        # Hoisted out of the loops: the probe loop below runs ~100 times per
+        # idle second, and locals skip the attribute lookups.
+        monotonic_ns = time.monotonic_ns
+        sleep = time.sleep
+        wake_clear = self._wake.clear
+        wake_wait = self._wake.wait
+        check_kill_switch = self._check_kill_switch
+        process_alerts_batch = self.process_alerts_batch
+        fetch_new_alerts = self._fetch_new_alerts
+        execute = conn.execute
 
         LOGGER.info(
-            "Monitoring alerts from %s (adaptive poll %.0fms–%.1fs)",
-            db_path,
-            min_sleep * 1000,
+            "Monitoring alerts from %s (%s, idle up to %.1fs)",
+            self.db_path,
+            "inotify wake-ups" if db_watch is not None else f"data_version probes every {version_probe * 1000:.0f}ms",
             max_sleep,
         )
 
-        while True:
-            self._check_kill_switch()
-            with self._open_conn() as conn:
-                cur = conn.cursor()
-                cur.execute(
-                    """
-                    SELECT rowid, symbol, direction, price
-                    FROM alerts
-                    WHERE rowid > ?
-                    ORDER BY rowid ASC
-                    """,
-                    (self.last_alert_id,),
-                )
-                rows = cur.fetchall()
-
-            for row in rows:
-                self.process_alert(
-                    int(row["rowid"]),
-                    row["symbol"],
-                    row["direction"],
-                    float(row["price"]),
-                    persist_state=False,
-                )
-
-            if rows and not self.dry_run:
-                self._save_state()
-
-            activity_detected = bool(rows)
-            db_mtime_snapshot = db_path.stat().st_mtime if db_path.exists() else last_db_mtime
-
-            if activity_detected:
-                idle_sleep = min_sleep
-                last_db_mtime = db_mtime_snapshot
-                time.sleep(idle_sleep)
-                continue
-
-            target_sleep = min(idle_sleep * 2, max_sleep)
-            wake_deadline = time.monotonic() + target_sleep
-            woke_for_write = False
-
-            while time.monotonic() < wake_deadline:
-                time.sleep(mtime_probe)
-                current_mtime = db_path.stat().st_mtime if db_path.exists() else 0.0
-                if current_mtime != db_mtime_snapshot:
-                    woke_for_write = True
-                    db_mtime_snapshot = current_mtime
-                    break
-
-            last_db_mtime = db_mtime_snapshot
-            idle_sleep = min_sleep if woke_for_write else target_sleep
-
-            if woke_for_write:
-                continue
+        try:
+            while True:
+                # Cleared before the query: a commit after this point either
+                # shows up in the rows or sets the event again.
+                wake_clear()
+                check_kill_switch()
+                try:
+                    rows = fetch_new_alerts(conn)
+                    if not rows and db_watch is None:
+                        # Snapshot after the query: commits from here on wake the probe.
+                        data_version = execute("PRAGMA data_version").fetchone()[0]
+                except sqlite3.OperationalError as exc:
+                    LOGGER.warning("Alerts query failed (%s); reopening read connection", exc)
+                    sleep(min_sleep)
+                    try:
+                        conn.close()
+                    except sqlite3.Error:
+                        pass
+                    conn = self._open_poll_conn()
+                    execute = conn.execute
+                    continue
+
+                if rows:
+                    process_alerts_batch(rows)
+                    idle_sleep_ns = _POLL_MIN_SLEEP_NS
+                    # A full batch means a backlog: drain it without sleeping.
+                    if len(rows) < _NEW_ALERTS_LIMIT:
+                        sleep(min_sleep)
+                    continue
+
+                if db_watch is not None:
+                    wake_wait(max_sleep)
+                    continue
+
+                target_sleep_ns = min(idle_sleep_ns * 2, max_sleep_ns)
+                wake_deadline = monotonic_ns() + target_sleep_ns
+                woke_for_write = False
+
+                while monotonic_ns() < wake_deadline:
+                    sleep(version_probe)
+                    try:
+                        current_version = execute("PRAGMA data_version").fetchone()[0]
+                    except sqlite3.OperationalError:
+                        # Let the alerts query above hit the error and reopen.
+                        woke_for_write = True
+                        break
+                    if current_version != data_version:
+                        woke_for_write = True
+                        break
+
+                idle_sleep_ns = _POLL_MIN_SLEEP_NS if woke_for_write else target_sleep_ns
+        finally:
+            if db_watch is not None:
+                db_watch_stop.set()
+                db_watch.join()
+            conn.close()
+
+    def _start_db_watch(self, stop: threading.Event) -> Optional[threading.Thread]:
+        # Our own live_orders writer commits to the same -wal file, and
+        # inotify can't tell whose write it was, so each order batch also
+        # wakes run() for one indexed SELECT that comes back empty. That is at
+        # most one extra query per batch, which is cheaper than risking a
+        # missed wake-up by trying to mask our own writes.
+        if INotify is None:
+            return None
+        try:
+            watch = INotify()
+            watch.add_watch(
+                str(self.db_path.parent),
+                inotify_flags.MODIFY | inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE,
+            )
+        except OSError as exc:
+            LOGGER.warning("DB watch unavailable, falling back to data_version probes: %s", exc)
+            return None
+        db_names = {self.db_path.name, self.db_path.name + "-wal"}
+
+        def watch_db() -> None:
+            try:
+                while not stop.is_set():
+                    events = watch.read(timeout=_WATCH_READ_TIMEOUT_MS)
+                    if any(event.name in db_names for event in events):
+                        self._wake.set()
+            except OSError as exc:
+                LOGGER.warning("DB watch failed, run() falls back to its idle timeout: %s", exc)
+            finally:
+                watch.close()
+
+        thread = threading.Thread(target=watch_db, name="alerts-db-watch", daemon=True)
+        thread.start()
+        return thread
 
 
 def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
@@ -18,6 +18,21 @@ SLIPPAGE = 0.001
 COMMISSION = 0.0
 STATE_FILE = "paper_trader_state.json"
 
+# New-alerts query for the monitor loop. Kept as one constant so every poll
+# sends identical SQL and the loop connection's statement cache reuses it.
+# LIMIT bounds the work per poll when a backlog builds up; the loop re-polls
+# immediately after a full batch.
+SELECT_ALERTS_LIMIT = 1000
+SELECT_ALERTS_SQL = (
+    "SELECT rowid, symbol, direction, price FROM alerts WHERE rowid > ? "
+    f"ORDER BY rowid ASC LIMIT {SELECT_ALERTS_LIMIT}"
+)
+
+# Monitor loop cadence in integer nanoseconds (deadlines use time.monotonic_ns).
+MIN_SLEEP_NS = 50_000_000           # 50ms fast path while alerts are flowing
+VERSION_PROBE_NS = 10_000_000       # 10ms data_version probe while idle
+MAX_SLEEP_NS = 2_000_000_000        # back off to 2s when idle
+
 
 class PaperTrader:
     """Paper trading engine — FLIP-ONLY version.
@@ -70,6 +85,13 @@ class PaperTrader:
         conn.row_factory = sqlite3.Row
         return conn
 
+    def _open_poll_conn(self) -> sqlite3.Connection:
+        # The monitor loop's long-lived connection; rows are unpacked
+        # positionally, so they stay plain tuples.
+        conn = self._open_conn()
+        conn.row_factory = None
+        return conn
+
     def _init_db_schema(self) -> None:
         with self._open_conn() as conn:
             cur = conn.cursor()
@@ -271,39 +293,54 @@ class PaperTrader:
         # minimum to react quickly; consecutive empty polls (no rows newer
         # than last_alert_id) double the wait time up to a 2s ceiling to
         # avoid hot loops when idle. To avoid sleeping through a new alert
-        # that arrives just after a poll, we watch for DB file writes during
-        # the longer idle backoff and wake early when the file mtime changes.
+        # that arrives just after a poll, we watch for DB commits during the
+        # longer idle backoff and wake early when PRAGMA data_version changes.
         # Fast-path latency target when alerts are flowing. Compared to the
         # original fixed 1s poll, a new alert is usually seen within ~50ms
-        # after activity or ~10ms during idle file-probing.
-        min_sleep = 0.05
+        # after activity or ~10ms during idle probing.
+        min_sleep = MIN_SLEEP_NS / 1_000_000_000
 
-        # While idling we probe the DB file mtime on a tighter cadence so a
+        # While idling we read PRAGMA data_version on a tighter cadence so a
         # newly written alert is noticed within ~10ms even if the outer backoff
-        # has grown toward the 2s ceiling.
-        mtime_probe = 0.01
-
-        max_sleep = 2.0    # back off to 2s when idle
-        idle_sleep = min_sleep
-        db_path = Path(DB_PATH)
-        last_db_mtime = db_path.stat().st_mtime if db_path.exists() else 0.0
+        # has grown toward the 2s ceiling. data_version changes on every commit
+        # from another connection (including ones that only reach the -wal
+        # file, which the DB file's mtime never shows), and it is tracked per
+        # connection, so the loop keeps one connection open.
+        version_probe = VERSION_PROBE_NS / 1_000_000_000
+
+        idle_sleep_ns = MIN_SLEEP_NS
+        conn = self._open_poll_conn()
+
+        # Bound once: the probe loop below runs ~100 times per idle second.
+        execute = conn.execute
+        monotonic_ns = time.monotonic_ns
+        sleep = time.sleep
+        positions = self.positions
+        update_position_db = self._update_position_db
 
         while True:
-            with self._open_conn() as conn:
-                cur = conn.cursor()
-                cur.execute("""
-                    SELECT rowid, symbol, direction, price
-                    FROM alerts
-                    WHERE rowid > ?
-                    ORDER BY rowid ASC
-                """, (self.last_alert_id,))
-                rows = cur.fetchall()
+            try:
+                rows = execute(SELECT_ALERTS_SQL, (self.last_alert_id,)).fetchall()
+                # Snapshot after the query: later commits wake the probe below.
+                data_version = execute("PRAGMA data_version").fetchone()[0]
+            except sqlite3.OperationalError as e:
+                # Same recovery as LiveTrader.run: drop the long-lived
+                # connection and start over on a fresh one.
+                print(f"[PAPER] Alerts query failed ({e}); reopening connection", flush=True)
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+                sleep(min_sleep)
+                conn = self._open_poll_conn()
+                execute = conn.execute
+                continue
 
             for row in rows:
                 alert_id, symbol, direction, price = row
                 self.last_alert_id = alert_id
 
-                pos = self.positions.get(symbol, {})
+                pos = positions.get(symbol, {})
                 current_qty = pos.get("qty", 0)
 
                 # ASK-HEAVY → SHORT
@@ -323,37 +360,36 @@ class PaperTrader:
                         self._buy(symbol, POSITION_SIZE, price)
 
                 # Update current price and PnL even when no trade is executed
-                self._update_position_db(symbol, cur_price=price)
-
-            activity_detected = bool(rows)
-
-            # Track DB file changes so we can wake early from long sleeps.
-            db_mtime_snapshot = db_path.stat().st_mtime if db_path.exists() else last_db_mtime
-
-            if activity_detected:
-                # Fresh alerts observed → use minimum sleep for quick response.
-                idle_sleep = min_sleep
-                last_db_mtime = db_mtime_snapshot
-                time.sleep(idle_sleep)
+                update_position_db(symbol, cur_price=price)
+
+            if rows:
+                # Fresh alerts observed → use minimum sleep for quick response,
+                # or none at all while draining a backlog of full batches.
+                idle_sleep_ns = MIN_SLEEP_NS
+                if len(rows) < SELECT_ALERTS_LIMIT:
+                    sleep(min_sleep)
                 continue
 
             # No alerts observed → back off exponentially up to the ceiling,
-            # but poll the DB mtime every few milliseconds so we can break out
-            # quickly if new alerts are inserted right after the query.
-            target_sleep = min(idle_sleep * 2, max_sleep)
-            wake_deadline = time.monotonic() + target_sleep
+            # but check data_version every few milliseconds so we can break
+            # out quickly if new alerts are inserted right after the query.
+            target_sleep_ns = min(idle_sleep_ns * 2, MAX_SLEEP_NS)
+            wake_deadline = monotonic_ns() + target_sleep_ns
             woke_for_write = False
 
-            while time.monotonic() < wake_deadline:
-                time.sleep(mtime_probe)
-                current_mtime = db_path.stat().st_mtime if db_path.exists() else 0.0
-                if current_mtime != db_mtime_snapshot:
+            while monotonic_ns() < wake_deadline:
+                sleep(version_probe)
+                try:
+                    current_version = execute("PRAGMA data_version").fetchone()[0]
+                except sqlite3.OperationalError:
+                    # Let the alerts query above hit the error and reopen.
+                    woke_for_write = True
+                    break
+                if current_version != data_version:
                     woke_for_write = True
-                    db_mtime_snapshot = current_mtime
                     break
 
-            last_db_mtime = db_mtime_snapshot
-            idle_sleep = min_sleep if woke_for_write else target_sleep
+            idle_sleep_ns = MIN_SLEEP_NS if woke_for_write else target_sleep_ns
 
             # If a write occurred, immediately loop to fetch new alerts; if not,
             # we've already slept the full backoff duration via the wake loop.
@@ -0,0 +1,561 @@
+import asyncio
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+import grok
+
+
+def _alert_row(rowid, symbol="AAA"):
+    return (rowid, 1700000000.0 + rowid, symbol, 2.0, 100, 500, 5, "ask-heavy", 10.0)
+
+
+def _book(symbol, bids, asks):
+    """Named-key L2 payload; bids/asks are lists of (price, [(exchange, size), ...])."""
+    return {
+        "key": symbol,
+        "BIDS": [
+            {"BID_PRICE": price, "BIDS": [{"EXCHANGE": ex, "BID_VOLUME": size} for ex, size in orders]}
+            for price, orders in bids
+        ],
+        "ASKS": [
+            {"ASK_PRICE": price, "ASKS": [{"EXCHANGE": ex, "ASK_VOLUME": size} for ex, size in orders]}
+            for price, orders in asks
+        ],
+    }
+
+
+_ASK_HEAVY_VENUES = ("NYSE", "MEMX", "IEXG", "ARCX", "EDGX")
+
+
+class GrokDbTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "alerts.db")
+        self.pool = grok.SqlitePool(self.db_path, readers=2)
+        grok.conn = self.pool.writer
+        grok._ensure_alerts_schema(grok.conn)
+
+    def tearDown(self):
+        grok.conn = None
+        self.pool.close()
+        self.tmpdir.cleanup()
+
+    def _alert_ids(self):
+        with sqlite3.connect(self.db_path) as conn:
+            return [row[0] for row in conn.execute("SELECT rowid FROM alerts ORDER BY rowid")]
+
+
+class AlertWriterTest(GrokDbTestCase):
+    def setUp(self):
+        super().setUp()
+        self._batch = (grok.ALERT_BATCH_MAX, grok.ALERT_BATCH_WINDOW_SEC)
+
+    def tearDown(self):
+        grok.ALERT_BATCH_MAX, grok.ALERT_BATCH_WINDOW_SEC = self._batch
+        grok.alert_write_queue = None
+        super().tearDown()
+
+    def test_batches_by_size_and_writes_partial_batch_on_cancel(self):
+        grok.ALERT_BATCH_MAX = 3
+        grok.ALERT_BATCH_WINDOW_SEC = 10.0
+
+        async def scenario():
+            grok.alert_write_queue = asyncio.Queue()
+            for rowid in range(1, 5):
+                grok.alert_write_queue.put_nowait(_alert_row(rowid))
+            task = asyncio.create_task(grok._alert_writer_task())
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if len(self._alert_ids()) == 3:
+                    break
+            written_before_cancel = self._alert_ids()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return written_before_cancel
+
+        self.assertEqual(asyncio.run(scenario()), [1, 2, 3])
+        self.assertEqual(self._alert_ids(), [1, 2, 3, 4])
+
+    def test_flushes_after_batch_window(self):
+        grok.ALERT_BATCH_MAX = 50
+        grok.ALERT_BATCH_WINDOW_SEC = 0.01
+
+        async def scenario():
+            grok.alert_write_queue = asyncio.Queue()
+            task = asyncio.create_task(grok._alert_writer_task())
+            grok.alert_write_queue.put_nowait(_alert_row(1))
+            await asyncio.sleep(0.1)
+            written = self._alert_ids()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return written
+
+        self.assertEqual(asyncio.run(scenario()), [1])
+
+    def test_contended_commit_does_not_block_event_loop(self):
+        grok.ALERT_BATCH_MAX = 1
+        grok.conn.execute("PRAGMA busy_timeout=2000")
+        blocker = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        blocker.execute("BEGIN IMMEDIATE")
+
+        async def scenario():
+            grok.alert_write_queue = asyncio.Queue()
+            task = asyncio.create_task(grok._alert_writer_task())
+            grok.alert_write_queue.put_nowait(_alert_row(1))
+            ticks = 0
+            for _ in range(20):
+                await asyncio.sleep(0.01)
+                ticks += 1
+            written_while_locked = self._alert_ids()
+            blocker.execute("COMMIT")
+            for _ in range(200):
+                await asyncio.sleep(0.01)
+                if self._alert_ids():
+                    break
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return ticks, written_while_locked
+
+        try:
+            ticks, written_while_locked = asyncio.run(scenario())
+        finally:
+            blocker.close()
+        self.assertEqual(ticks, 20)
+        self.assertEqual(written_while_locked, [])
+        self.assertEqual(self._alert_ids(), [1])
+
+    def test_drain_writes_queued_rows(self):
+        async def scenario():
+            grok.alert_write_queue = asyncio.Queue()
+            grok.alert_write_queue.put_nowait(_alert_row(1))
+            grok.alert_write_queue.put_nowait(_alert_row(2))
+            grok._drain_alert_queue()
+
+        asyncio.run(scenario())
+        self.assertEqual(self._alert_ids(), [1, 2])
+
+    def test_bad_row_only_drops_itself(self):
+        grok._write_alert_rows([_alert_row(2)])
+        grok._write_alert_rows([_alert_row(1), _alert_row(2, "DUP"), _alert_row(3)])
+
+        self.assertEqual(self._alert_ids(), [1, 2, 3])
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute("SELECT symbol FROM alerts WHERE rowid = 2").fetchone()[0], "AAA")
+
+    def test_locked_batch_is_retried(self):
+        blocker = sqlite3.connect(self.db_path, isolation_level=None)
+        grok.conn.execute("PRAGMA busy_timeout=0")
+        blocker.execute("BEGIN IMMEDIATE")
+        calls = []
+        real_insert = grok._insert_alert_batch
+
+        def insert_then_release(rows):
+            calls.append(len(rows))
+            if len(calls) == 2:
+                blocker.execute("COMMIT")
+            return real_insert(rows)
+
+        grok._insert_alert_batch = insert_then_release
+        try:
+            grok._write_alert_rows([_alert_row(1), _alert_row(2)])
+        finally:
+            grok._insert_alert_batch = real_insert
+            blocker.close()
+
+        self.assertEqual(calls, [2, 2])
+        self.assertEqual(self._alert_ids(), [1, 2])
+
+
+class AlertRowidBookkeepingTest(GrokDbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.symbol = "AAA"
+        grok._init_symbol_state((self.symbol,))
+        grok.last_l1[self.symbol] = {"LAST_PRICE": 10.0}
+        self.cfg = grok.Config(
+            min_volume=0, min_imbalance_duration_sec=0.0, alert_throttle_sec=0, book_coalesce_ms=0
+        )
+        self._saved_rowid = grok.last_alert_rowid
+
+    def tearDown(self):
+        grok.last_alert_rowid = self._saved_rowid
+        grok.alert_write_queue = None
+        for state in (grok.last_l1, grok.last_alert, grok.current_direction, grok.direction_ticks,
+                      grok._VENUE_STATE, grok._last_chart_or_timesale_ts, grok._last_volume_fallback_ts):
+            state.pop(self.symbol, None)
+        super().tearDown()
+
+    def test_alert_ids_continue_from_seeded_max_rowid(self):
+        grok._write_alert_rows([_alert_row(7)])
+        book = _book(
+            self.symbol,
+            [(10.00, [(ex, 100) for ex in _ASK_HEAVY_VENUES])],
+            [(10.01, [(ex, 500) for ex in _ASK_HEAVY_VENUES])],
+        )
+
+        async def scenario():
+            grok.alert_write_queue = asyncio.Queue()
+            grok.last_alert_rowid = grok.conn.execute("SELECT IFNULL(MAX(rowid), 0) FROM alerts").fetchone()[0]
+            now = 1700000100.0
+            grok._evaluate_book(book, self.symbol, now, 100.0, self.cfg)
+            grok._evaluate_book(book, self.symbol, now + 1, 101.0, self.cfg)
+            queued = [grok.alert_write_queue.get_nowait() for _ in range(grok.alert_write_queue.qsize())]
+            grok._write_alert_rows(queued)
+            return queued
+
+        queued = asyncio.run(scenario())
+        self.assertEqual([row[0] for row in queued], [8, 9])
+        self.assertEqual([row[7] for row in queued], ["ask-heavy", "ask-heavy"])
+        self.assertEqual(grok.last_alert_rowid, 9)
+        self.assertEqual(self._alert_ids(), [7, 8, 9])
+
+    def test_streak_duration_spans_at_most_the_last_200_ticks(self):
+        cfg = grok.Config(min_volume=0, min_imbalance_duration_sec=1e9, alert_throttle_sec=0, book_coalesce_ms=0)
+        ask_heavy = _book(
+            self.symbol,
+            [(10.00, [(ex, 100) for ex in _ASK_HEAVY_VENUES])],
+            [(10.01, [(ex, 500) for ex in _ASK_HEAVY_VENUES])],
+        )
+        bid_heavy = _book(
+            self.symbol,
+            [(10.00, [(ex, 500) for ex in _ASK_HEAVY_VENUES])],
+            [(10.01, [(ex, 100) for ex in _ASK_HEAVY_VENUES])],
+        )
+        now = 1700000000.0
+        for tick in range(250):
+            grok._evaluate_book(ask_heavy, self.symbol, now + tick, float(tick), cfg)
+        streak = grok.direction_ticks[self.symbol]
+        self.assertEqual(len(streak), 200)
+        self.assertEqual(streak[-1] - streak[0], 199.0)
+
+        grok._evaluate_book(bid_heavy, self.symbol, now + 250, 250.0, cfg)
+        self.assertEqual(grok.current_direction[self.symbol], "bid-heavy")
+        self.assertEqual(list(grok.direction_ticks[self.symbol]), [250.0])
+
+    def test_volume_fallback_runs_for_unseen_symbol_right_after_boot(self):
+        book = _book(self.symbol, [(10.00, [("NYSE", 300)])], [(10.01, [("NYSE", 100)])])
+        sid = grok.SYM_ID[self.symbol]
+        # A monotonic clock only a few seconds past boot.
+        grok._evaluate_book(book, self.symbol, 1700000000.0, 3.0, self.cfg)
+        self.assertEqual(len(grok.trades[sid]), 1)
+        self.assertEqual(grok._last_volume_fallback_ts[self.symbol], 3.0)
+
+        # Within 10s of that fallback no second estimate is added.
+        grok._evaluate_book(book, self.symbol, 1700000001.0, 4.0, self.cfg)
+        self.assertEqual(len(grok.trades[sid]), 1)
+
+
+def _reference_metrics(payload, max_range_cents):
+    """Dict-based book metrics as grok computed them before the NumPy rewrite."""
+    venues = {}
+    for side, src_key, price_key, vol_key in ((0, "BIDS", "BID_PRICE", "BID_VOLUME"),
+                                              (1, "ASKS", "ASK_PRICE", "ASK_VOLUME")):
+        entries = payload.get(src_key) or []
+        if not isinstance(entries, list):
+            continue
+        for level in entries:
+            if not isinstance(level, dict) or level.get(price_key) is None:
+                continue
+            try:
+                price = float(level[price_key])
+            except (TypeError, ValueError):
+                continue
+            if price <= 0:
+                continue
+            for order in level.get(src_key) or []:
+                if not isinstance(order, dict):
+                    continue
+                ex = (order.get("EXCHANGE") or "").upper()
+                ex = "NASDAQ" if ex == "NSDQ" else ex
+                if ex not in grok.EXCHANGE_MAP:
+                    continue
+                try:
+                    size = int(float(order.get(vol_key)))
+                except (TypeError, ValueError):
+                    continue
+                if size <= 0:
+                    continue
+                cell = venues.setdefault(ex, [0, 0, [], []])
+                cell[side] += size
+                cell[2 + side].append(price)
+    per_venue = {}
+    for ex, (bid_sum, ask_sum, bid_prices, ask_prices) in venues.items():
+        if bid_prices and ask_prices and (min(ask_prices) - max(bid_prices)) * 100.0 <= max_range_cents:
+            per_venue[ex] = (bid_sum, ask_sum)
+    total_bids = sum(b for b, _ in per_venue.values())
+    total_asks = sum(a for _, a in per_venue.values())
+    all_bids = [p for cell in venues.values() for p in cell[2]]
+    all_asks = [p for cell in venues.values() for p in cell[3]]
+    return {
+        "total_bids": total_bids,
+        "total_asks": total_asks,
+        "ask_to_bid_ratio": total_asks / total_bids if total_bids else math.inf,
+        "bid_to_ask_ratio": total_bids / total_asks if total_asks else math.inf,
+        "ask_heavy_venues": sum(1 for b, a in per_venue.values() if a > b),
+        "bid_heavy_venues": sum(1 for b, a in per_venue.values() if b > a),
+        "per_venue": per_venue,
+        "valid_exchanges": len(per_venue),
+        "top_bid": max(all_bids, default=0.0),
+        "top_ask": min(all_asks, default=0.0),
+    }
+
+
+class _NoCompiledParser:
+    """Stands in for _book_ext when the compiled parser rejects every side."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def parse_side(self, entries, keys, ex_ids):
+        self.calls += 1
+        return None
+
+
+class ProcessBookParityTest(unittest.TestCase):
+    symbol = "PAR"
+
+    def setUp(self):
+        grok._VENUE_STATE.pop(self.symbol, None)
+
+    def tearDown(self):
+        grok._VENUE_STATE.pop(self.symbol, None)
+
+    def _assert_matches_reference(self, payload, cfg):
+        metrics = grok.process_book(grok._flatten_l2(payload), self.symbol, cfg)
+        expected = _reference_metrics(payload, cfg.max_range_cents)
+        actual = {
+            "total_bids": metrics.total_bids,
+            "total_asks": metrics.total_asks,
+            "ask_to_bid_ratio": metrics.ask_to_bid_ratio,
+            "bid_to_ask_ratio": metrics.bid_to_ask_ratio,
+            "ask_heavy_venues": metrics.ask_heavy_venues,
+            "bid_heavy_venues": metrics.bid_heavy_venues,
+            "per_venue": {grok._EX_CODES[vid]: sizes for vid, sizes in metrics.per_venue.items()},
+            "valid_exchanges": metrics.valid_exchanges,
+            "top_bid": metrics.top_bid,
+            "top_ask": metrics.top_ask,
+        }
+        self.assertEqual(actual, expected)
+        return metrics
+
+    def _books(self):
+        balanced = _book(
+            self.symbol,
+            [(10.00, [("NYSE", 300), ("MEMX", 200)]), (9.99, [("NYSE", 50), ("EDGX", 40)])],
+            [(10.01, [("NYSE", 100), ("MEMX", 400)]), (10.02, [("EDGX", 60)]), (10.05, [("IEXG", 70)])],
+        )
+        ask_heavy = _book(
+            self.symbol,
+            [(10.00, [(ex, 100) for ex in _ASK_HEAVY_VENUES]), (9.98, [("NSDQ", 25)])],
+            [(10.01, [(ex, 500) for ex in _ASK_HEAVY_VENUES]), (10.00, [("NSDQ", 10)])],
+        )
+        malformed = _book(
+            self.symbol,
+            [(10.00, [("nyse", 120), ("BOGUS", 50), ("ARCX", "12.5"), ("EDGX", "x"), ("MEMX", 0)]),
+             ("abc", [("NYSE", 10)]), (-1.0, [("NYSE", 10)]), (9.90, [])],
+            [(10.01, [("NYSE", 80), ("ARCX", 40)]), (10.02, [("EDGX", 30)])],
+        )
+        malformed["BIDS"].append("not-a-level")
+        malformed["BIDS"].append({"BIDS": [{"EXCHANGE": "NYSE", "BID_VOLUME": 5}]})
+        malformed["ASKS"][0]["ASKS"].append("not-an-order")
+        one_sided = _book(self.symbol, [(10.00, [("NYSE", 100)])], [])
+        return [balanced, balanced, ask_heavy, ask_heavy, malformed, balanced, one_sided, one_sided]
+
+    def test_sequence_matches_dict_reference(self):
+        cfg = grok.Config()
+        previous = None
+        previous_payload = None
+        for payload in self._books():
+            metrics = self._assert_matches_reference(payload, cfg)
+            if payload is previous_payload:
+                # Unchanged venue totals reuse the previous metrics object.
+                self.assertIs(metrics, previous)
+            previous, previous_payload = metrics, payload
+
+    def test_range_change_recomputes_reused_book(self):
+        payload = self._books()[0]
+        first = self._assert_matches_reference(payload, grok.Config(max_range_cents=1))
+        wider = self._assert_matches_reference(payload, grok.Config(max_range_cents=5))
+        self.assertIsNot(first, wider)
+        self.assertGreater(wider.valid_exchanges, first.valid_exchanges)
+
+    def test_compiled_parser_fallback_matches_reference(self):
+        saved = grok._book_ext
+        grok._book_ext = stub = _NoCompiledParser()
+        try:
+            for payload in self._books():
+                self._assert_matches_reference(payload, grok.Config())
+        finally:
+            grok._book_ext = saved
+        self.assertGreater(stub.calls, 0)
+
+
+class RingBufferTest(unittest.TestCase):
+    def _live(self, buf):
+        return buf.ts[buf.start:buf.end].tolist(), buf.sz[buf.start:buf.end].tolist()
+
+    def test_prune_drops_prints_before_cutoff(self):
+        buf = grok.RingBuffer(capacity=8)
+        for i in range(5):
+            buf.append(float(i), 10.0 + i, i + 1)
+        buf.prune(2.0)
+        self.assertEqual(self._live(buf), ([2.0, 3.0, 4.0], [3, 4, 5]))
+        buf.prune(2.0)
+        self.assertEqual(len(buf), 3)
+        buf.prune(10.0)
+        self.assertEqual(len(buf), 0)
+        buf.prune(11.0)
+        self.assertEqual(len(buf), 0)
+
+    def test_prune_stops_at_first_kept_out_of_order_print(self):
+        buf = grok.RingBuffer(capacity=8)
+        for ts in (1.0, 5.0, 3.0, 6.0):
+            buf.append(ts, 1.0, 1)
+        buf.prune(4.0)
+        self.assertEqual(self._live(buf)[0], [5.0, 3.0, 6.0])
+
+    def test_wraparound_compacts_live_rows_at_capacity(self):
+        buf = grok.RingBuffer(capacity=4)
+        for i in range(4):
+            buf.append(float(i), 1.0, i)
+        buf.prune(2.0)
+        buf.append(4.0, 1.0, 4)
+        self.assertEqual(len(buf.ts), 4)
+        self.assertEqual((buf.start, buf.end), (0, 3))
+        self.assertEqual(self._live(buf), ([2.0, 3.0, 4.0], [2, 3, 4]))
+
+    def test_grows_when_window_is_full(self):
+        buf = grok.RingBuffer(capacity=4)
+        for i in range(9):
+            buf.append(float(i), 100.0 + i, i)
+        self.assertEqual(len(buf.ts), 16)
+        self.assertEqual(self._live(buf), ([float(i) for i in range(9)], list(range(9))))
+        self.assertEqual(buf.px[buf.start:buf.end].tolist(), [100.0 + i for i in range(9)])
+
+    def test_prune_uses_configured_window(self):
+        saved_cfg = grok.CFG
+        grok._init_symbol_state(("RB",))
+        grok.CFG = grok.Config(window_seconds=60)
+        try:
+            sid = grok.SYM_ID["RB"]
+            for ts in (0.0, 39.9, 40.0, 90.0, 100.0):
+                grok.trades[sid].append(ts, 1.0, 1)
+            grok._prune(sid, 100.0)
+            self.assertEqual(grok.trades[sid].ts[grok.trades[sid].start:grok.trades[sid].end].tolist(),
+                             [40.0, 90.0, 100.0])
+        finally:
+            grok.CFG = saved_cfg
+
+
+class AlertsSchemaMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "alerts.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _migrate(self):
+        db = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            grok._ensure_alerts_schema(db)
+            columns = [row[1] for row in db.execute("PRAGMA table_info(alerts)")]
+            indexes = {row[1] for row in db.execute("PRAGMA index_list(alerts)")}
+            version = db.execute("PRAGMA user_version").fetchone()[0]
+            rows = db.execute("SELECT symbol, direction FROM alerts ORDER BY rowid").fetchall()
+        finally:
+            db.close()
+        return columns, indexes, version, rows
+
+    def test_migrates_unversioned_table_in_place(self):
+        with sqlite3.connect(self.db_path) as db:
+            db.execute("CREATE TABLE alerts (timestamp REAL, symbol TEXT, direction TEXT)")
+            db.execute("INSERT INTO alerts VALUES (1.0, 'OLD', 'bid-heavy')")
+        columns, indexes, version, rows = self._migrate()
+        self.assertEqual(sorted(columns), sorted(name for name, _ in grok._ALERT_COLUMNS))
+        self.assertIn("idx_alerts_symbol", indexes)
+        self.assertEqual(version, grok.ALERTS_SCHEMA_VERSION)
+        self.assertEqual(rows, [("OLD", "bid-heavy")])
+
+    def test_migrates_version_1_by_adding_symbol_index(self):
+        with sqlite3.connect(self.db_path) as db:
+            db.execute("CREATE TABLE alerts (%s)" % ", ".join(f"{n} {t}" for n, t in grok._ALERT_COLUMNS))
+            db.execute("INSERT INTO alerts (symbol, direction) VALUES ('V1', 'ask-heavy')")
+            db.execute("PRAGMA user_version=1")
+        columns, indexes, version, rows = self._migrate()
+        self.assertEqual(columns, [name for name, _ in grok._ALERT_COLUMNS])
+        self.assertIn("idx_alerts_symbol", indexes)
+        self.assertEqual(version, 2)
+        self.assertEqual(rows, [("V1", "ask-heavy")])
+
+    def test_current_version_is_left_alone(self):
+        self._migrate()
+        with sqlite3.connect(self.db_path) as db:
+            db.execute("DROP INDEX idx_alerts_symbol")
+        _, indexes, version, _ = self._migrate()
+        self.assertNotIn("idx_alerts_symbol", indexes)
+        self.assertEqual(version, grok.ALERTS_SCHEMA_VERSION)
+
+
+class SqlitePoolTest(GrokDbTestCase):
+    def test_readers_are_query_only(self):
+        with self.pool.borrow_reader() as reader:
+            with self.assertRaises(sqlite3.OperationalError):
+                reader.execute("INSERT INTO alerts (symbol) VALUES ('NOPE')")
+        self.assertEqual(self._alert_ids(), [])
+
+    def test_readers_see_writer_commits(self):
+        grok._write_alert_rows([_alert_row(1)])
+        with self.pool.borrow_reader() as reader:
+            self.assertEqual(reader.execute("SELECT MAX(rowid) FROM alerts").fetchone()[0], 1)
+
+    def test_concurrent_borrow_and_return(self):
+        grok._write_alert_rows([_alert_row(1)])
+        lock = threading.Lock()
+        active = [0]
+        peak = [0]
+        seen = set()
+        errors = []
+
+        def borrow():
+            try:
+                with self.pool.borrow_reader() as reader:
+                    with lock:
+                        active[0] += 1
+                        peak[0] = max(peak[0], active[0])
+                        seen.add(id(reader))
+                    # Leaves a read transaction open; borrow_reader rolls it back.
+                    reader.execute("BEGIN")
+                    reader.execute("SELECT COUNT(*) FROM alerts").fetchone()
+                    time.sleep(0.01)
+                    with lock:
+                        active[0] -= 1
+            except Exception as exc:  # pragma: no cover - surfaced below
+                errors.append(exc)
+
+        threads = [threading.Thread(target=borrow) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(peak[0], 2)
+        self.assertEqual(len(seen), 2)
+        returned = [self.pool._readers.get_nowait() for _ in range(2)]
+        self.assertTrue(self.pool._readers.empty())
+        self.assertFalse(any(reader.in_transaction for reader in returned))
+        for reader in returned:
+            self.pool._readers.put(reader)
+
+
+if __name__ == "__main__":
+    unittest.main()
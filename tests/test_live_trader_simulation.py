@@ -1,8 +1,13 @@
+import json
 import os
 import sqlite3
 import tempfile
+import threading
+import time
 import unittest
+from contextlib import contextmanager
 
+import live_trader
 from live_trader import LiveTrader
 
 
@@ -108,6 +113,7 @@ class LiveTraderInlineFlowTest(unittest.TestCase):
         self.trader.process_alert(1, "TEST", "ask-heavy", 10.0)
         self.assertEqual(self.trader.positions.get("TEST"), -1000)
 
+        self.trader.flush()
         with sqlite3.connect(self.db_path) as conn:
             cur = conn.cursor()
             cur.execute("SELECT COUNT(*) FROM live_orders")
@@ -122,6 +128,7 @@ class LiveTraderInlineFlowTest(unittest.TestCase):
         self.trader.process_alert(2, "TEST", "bid-heavy", 10.2)
         self.assertEqual(self.trader.positions.get("TEST"), 1000)
 
+        self.trader.flush()
         with sqlite3.connect(self.db_path) as conn:
             cur = conn.cursor()
             cur.execute("SELECT COUNT(*) FROM live_orders")
@@ -174,6 +181,7 @@ class LiveTraderInlineFlowTest(unittest.TestCase):
         trader = LiveTrader(dry_run=True, executor=executor)
 
         trader.process_alert(6, "REF", "ask-heavy", 10.0)
+        trader.flush()
 
         with sqlite3.connect(os.environ["DB_PATH"]) as conn:
             cur = conn.cursor()
@@ -182,6 +190,74 @@ class LiveTraderInlineFlowTest(unittest.TestCase):
 
         self.assertAlmostEqual(recorded_price, 11.8881, places=4)
 
+    def test_batch_processes_alerts_in_order_per_symbol(self):
+        rows = [
+            (10, "AAA", "ask-heavy", 5.0),
+            (11, "BBB", "bid-heavy", 7.0),
+            (12, "AAA", "bid-heavy", 5.1),
+            (13, "BBB", "bid-heavy", 7.1),
+        ]
+        self.trader.process_alerts_batch(rows)
+
+        self.assertEqual(self.trader.last_alert_id, 13)
+        self.assertEqual(
+            [(o["symbol"], o["side"], o["qty"]) for o in self.executor.submitted],
+            [("AAA", "SHORT", 1000), ("BBB", "BUY", 1000), ("AAA", "BUY", 2000)],
+        )
+        self.assertEqual(self.trader.positions, {"AAA": 1000, "BBB": 1000})
+
+    def test_batch_keeps_intermediate_flips_with_custom_flip_size(self):
+        os.environ["LIVE_FLIP_SIZE"] = "1500"
+        try:
+            executor = StubOrderExecutor()
+            trader = LiveTrader(dry_run=True, executor=executor)
+        finally:
+            os.environ.pop("LIVE_FLIP_SIZE", None)
+
+        trader.process_alerts_batch(
+            [
+                (20, "CCC", "ask-heavy", 3.0),
+                (21, "CCC", "ask-heavy", 3.0),
+                (22, "CCC", "bid-heavy", 3.1),
+                (23, "CCC", "ask-heavy", 3.0),
+                (24, "CCC", "bid-heavy", 3.2),
+            ]
+        )
+        trader.close()
+
+        self.assertEqual(
+            [(o["side"], o["qty"]) for o in executor.submitted],
+            [("SHORT", 1000), ("BUY", 1500), ("SHORT", 1500), ("BUY", 1500)],
+        )
+        self.assertEqual(trader.positions, {"CCC": 500})
+        with sqlite3.connect(self.db_path) as conn:
+            alert_ids = [row[0] for row in conn.execute("SELECT alert_rowid FROM live_orders ORDER BY id")]
+        self.assertEqual(alert_ids, [20, 22, 23, 24])
+
+    def test_batch_retries_repeat_after_failed_order(self):
+        results = iter([{"error": "rejected", "status_code": "400", "dry_run": False}])
+        submit_market = self.executor.submit_market
+
+        def flaky_submit_market(**kwargs):
+            response = submit_market(**kwargs)
+            return next(results, response)
+
+        self.executor.submit_market = flaky_submit_market
+        self.trader.process_alerts_batch(
+            [
+                (30, "DDD", "ask-heavy", 4.0),
+                (31, "DDD", "ask-heavy", 4.0),
+                (32, "DDD", "ask-heavy", 4.0),
+            ]
+        )
+
+        self.assertEqual(
+            [(o["side"], o["qty"]) for o in self.executor.submitted],
+            [("SHORT", 1000), ("SHORT", 1000)],
+        )
+        self.assertEqual(self.trader.positions, {"DDD": -1000})
+        self.assertEqual(self.trader.last_alert_id, 32)
+
     def test_limit_padding_direction(self):
         base_price = 50.0
         buy_price = self.trader._aggressive_limit_price(side="BUY", reference_price=base_price)
@@ -191,5 +267,223 @@ class LiveTraderInlineFlowTest(unittest.TestCase):
         self.assertLess(short_price, base_price)
 
 
+class LiveOrderWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "orders.db")
+        os.environ["DB_PATH"] = self.db_path
+        os.environ["LIVE_STATE_FILE"] = os.path.join(self.tmpdir.name, "state.json")
+        self.trader = LiveTrader(dry_run=True, executor=StubOrderExecutor())
+
+    def tearDown(self):
+        self.trader.close()
+        self.tmpdir.cleanup()
+        for key in ["DB_PATH", "LIVE_STATE_FILE"]:
+            os.environ.pop(key, None)
+
+    def _count_orders(self):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM live_orders").fetchone()[0]
+
+    def _queue_orders(self, n, start=0):
+        for i in range(start, start + n):
+            self.trader._record_order(
+                alert_id=i, symbol="SYM", direction="bid-heavy", side="BUY", qty=1, price=1.0, result={}
+            )
+
+    def test_close_flushes_queued_orders(self):
+        self.trader.order_batch_window = 10.0
+        self._queue_orders(5)
+        self.trader.close()
+        self.assertEqual(self._count_orders(), 5)
+
+    def test_flush_makes_queued_orders_readable(self):
+        self.trader.order_batch_window = 10.0
+        self._queue_orders(3)
+        self.assertTrue(self.trader.flush(timeout=5))
+        self.assertEqual(self._count_orders(), 3)
+
+    def test_close_waits_for_pool_orders(self):
+        started = threading.Event()
+
+        def slow_order():
+            started.wait(5)
+            time.sleep(0.05)
+            self._queue_orders(1)
+
+        self.trader._order_pool.submit(slow_order)
+        started.set()
+        self.trader.close()
+        self.assertEqual(self._count_orders(), 1)
+        with self.assertRaises(RuntimeError):
+            self.trader._order_pool.submit(slow_order)
+
+    def test_close_writes_pending_inline_state(self):
+        self.trader.close()
+        os.environ["LIVE_STATE_SAVE_DELAY_MS"] = "60000"
+        self.addCleanup(os.environ.pop, "LIVE_STATE_SAVE_DELAY_MS", None)
+        executor = StubOrderExecutor()
+        executor.dry_run = False
+        reader = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.addCleanup(reader.close)
+
+        @contextmanager
+        def borrow_reader():
+            yield reader
+
+        self.trader = LiveTrader(executor=executor, reader=borrow_reader)
+        self.trader.positions["SYM"] = 500
+        self.trader.last_alert_id = 7
+        self.trader._persist_state()
+        timer = self.trader._state_timer
+        self.assertIsNotNone(timer)
+        self.trader.close()
+        self.assertIsNone(self.trader._state_timer)
+        self.assertTrue(timer.finished.is_set())
+        with open(os.environ["LIVE_STATE_FILE"]) as fh:
+            state = json.load(fh)
+        self.assertEqual(state, {"positions": {"SYM": 500}, "last_alert_id": 7})
+
+    def test_multi_row_insert_chunk_boundaries(self):
+        self.assertEqual(live_trader._LIVE_ORDER_CHUNK_ROWS, 90)
+        total = 0
+        for n in (89, 90, 91):
+            rows = [
+                (total + i, "SYM", "bid-heavy", "BUY", 1, 1.0, None, "201", None, None, "{}")
+                for i in range(n)
+            ]
+            self.trader._write_order_rows(rows)
+            total += n
+            self.assertEqual(self._count_orders(), total)
+        with sqlite3.connect(self.db_path) as conn:
+            alert_ids = [row[0] for row in conn.execute("SELECT alert_rowid FROM live_orders ORDER BY id")]
+        self.assertEqual(alert_ids, list(range(total)))
+
+
+class RunLoopTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "run.db")
+        os.environ["DB_PATH"] = self.db_path
+        os.environ["LIVE_STATE_FILE"] = os.path.join(self.tmpdir.name, "state.json")
+        os.environ["LIVE_KILL_SWITCH_FILE"] = os.path.join(self.tmpdir.name, "kill_switch.flag")
+        self.executor = StubOrderExecutor()
+        self.trader = LiveTrader(dry_run=True, executor=self.executor)
+
+    def tearDown(self):
+        self.trader.close()
+        self.tmpdir.cleanup()
+        for key in ["DB_PATH", "LIVE_STATE_FILE", "LIVE_KILL_SWITCH_FILE"]:
+            os.environ.pop(key, None)
+
+    def test_poll_connection_alone_skips_busy_handler(self):
+        poll_conn = self.trader._open_poll_conn()
+        try:
+            self.assertEqual(poll_conn.execute("PRAGMA busy_timeout").fetchone()[0], 0)
+        finally:
+            poll_conn.close()
+        self.assertEqual(self.trader._read_db.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+
+    def test_emergency_flatten_warms_prices_once_before_fanning_out(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                "INSERT INTO alerts (symbol, direction, price) VALUES (?, ?, ?)",
+                [("AAA", "bid-heavy", 1.5), ("BBB", "ask-heavy", 2.5)],
+            )
+        self.trader.positions.update({"AAA": 1000, "BBB": -1000})
+        warm_threads = []
+        warm_last_prices = self.trader._warm_last_prices
+
+        def recording_warm():
+            warm_threads.append(threading.current_thread())
+            warm_last_prices()
+
+        self.trader._warm_last_prices = recording_warm
+        with self.assertRaises(SystemExit):
+            self.trader._engage_emergency_shutdown("test")
+
+        self.assertEqual(warm_threads, [threading.current_thread()])
+        self.assertTrue(self.trader.flush(timeout=5))
+        with sqlite3.connect(self.db_path) as conn:
+            legs = sorted(conn.execute("SELECT symbol, side, price FROM live_orders"))
+        self.assertEqual(legs, [("AAA", "SELL", 1.5), ("BBB", "COVER", 2.5)])
+
+    def test_run_picks_up_new_alerts_and_stops_on_kill_switch(self):
+        exits = []
+
+        def run():
+            try:
+                self.trader.run()
+            except SystemExit as exc:
+                exits.append(exc.code)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO alerts (symbol, direction, price) VALUES ('RUN', 'bid-heavy', 2.0)")
+        for _ in range(300):
+            if self.executor.submitted:
+                break
+            time.sleep(0.01)
+        self.assertEqual([(o["symbol"], o["side"]) for o in self.executor.submitted], [("RUN", "BUY")])
+        self.assertEqual(self.trader._read_db.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+
+        self.trader.kill_switch_path.touch()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(exits, [1])
+
+
+@unittest.skipIf(live_trader.INotify is None, "inotify_simple not installed")
+class InotifyWatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "watch.db")
+        os.environ["DB_PATH"] = self.db_path
+        os.environ["LIVE_STATE_FILE"] = os.path.join(self.tmpdir.name, "state.json")
+        os.environ["LIVE_KILL_SWITCH_FILE"] = os.path.join(self.tmpdir.name, "kill_switch.flag")
+        self.trader = LiveTrader(dry_run=True, executor=StubOrderExecutor())
+
+    def tearDown(self):
+        self.trader.close()
+        self.tmpdir.cleanup()
+        for key in ["DB_PATH", "LIVE_STATE_FILE", "LIVE_KILL_SWITCH_FILE"]:
+            os.environ.pop(key, None)
+
+    def test_db_watch_wakes_on_commit_and_stops(self):
+        stop = threading.Event()
+        thread = self.trader._start_db_watch(stop)
+        self.trader._wake.clear()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO alerts (symbol, direction, price) VALUES ('W', 'bid-heavy', 1.0)")
+        self.assertTrue(self.trader._wake.wait(2))
+
+        stop.set()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+
+    def _wait_for(self, predicate):
+        for _ in range(200):
+            if predicate():
+                return True
+            time.sleep(0.01)
+        return False
+
+    def test_kill_switch_clears_when_file_is_removed(self):
+        kill_path = self.trader.kill_switch_path
+        kill_path.touch()
+        self.assertTrue(self._wait_for(self.trader._kill_flag.is_set))
+        with self.assertRaises(SystemExit):
+            self.trader._check_kill_switch()
+
+        kill_path.unlink()
+        self.assertTrue(self._wait_for(lambda: not self.trader._kill_flag.is_set()))
+        self.trader._check_kill_switch()
+
+    def test_stale_kill_flag_is_confirmed_against_the_file(self):
+        self.trader._kill_flag.set()
+        self.trader._check_kill_switch()
+
+
 if __name__ == "__main__":
     unittest.main()